@@ -0,0 +1,181 @@
+import os, sys, imp, json, time, shutil, resource, tempfile, argparse, multiprocessing, numpy as np, pandas as p
+from collections import OrderedDict
+from sklearn.feature_extraction.text import TfidfVectorizer
+import main
+
+## benchmark suite
+# Generates synthetic StumbleUpon-like train and test tsv files (url, urlid, boilerplate json, label) for every
+# (number of documents, words per document) configuration and times every stage of main.py on them:
+# loading, extract_content, url_cleaner, stemming, get_high_frequence_words, create_TF_IDF and fit_train_and_test_data for every model.
+# Only functions (and arguments) of the original main.py are called and stages are timed here, so that any version of main.py can be benchmarked:
+# --main-file main_baseline.py (e.g. from "git show <commit>:Script/main.py") gives the baseline that later versions are compared with.
+# Stages are recorded as "<stage>/n=<documents>/w=<words per document>" in same json format as main.py --metrics-json,
+# so that results can be compared with --baseline or with python main.py --compare baseline.json current.json.
+# Stemming and the other stages of every configuration run in separate new processes, so that timings are not helped by words stemmed
+# by an earlier stage (in versions of main.py which keep stemmed words) and peak_rss_mb is not inflated by earlier configurations.
+
+# words of ephimeral (news) pages, evergreen (recipes, how-to) pages and both
+ephimeral_words = ['election', 'today', 'breaking', 'season', 'game', 'score', 'celebrity', 'week', 'announced', 'report', 'video', 'photos', 'sale', 'deal', 'fashion', 'trailer']
+evergreen_words = ['recipe', 'bake', 'chicken', 'chocolate', 'minutes', 'oven', 'cup', 'sugar', 'health', 'exercise', 'diy', 'tips', 'guide', 'learn', 'garden', 'homemade']
+common_words = ['the', 'and', 'of', 'to', 'in', 'for', 'with', 'about', 'this', 'that', 'page', 'home', 'contact', 'share', 'comments', 'email', 'cannot', "it's", "don't", '2013', '10'] + ['word%d' % i for i in range(5000)]
+
+# writing n_documents synthetic pages to path, in same quoted tab separated format as train.tsv (labelled) or test.tsv
+# topic_fraction of words of a page (a third by default) come from words of its category, title is null for every tenth page
+def write_synthetic_tsv(path, n_documents, words_per_document, labelled=True, first_urlid=0, random_state=0, topic_fraction=0.3):
+	random = np.random.RandomState(random_state)
+	with open(path, 'wb') as tsv_file:
+		writer = csv.writer(tsv_file, delimiter='\t', quoting=csv.QUOTE_ALL, lineterminator='\n')
+		writer.writerow(['url', 'urlid', 'boilerplate', 'label'] if labelled else ['url', 'urlid', 'boilerplate'])
+		for document in range(n_documents):
+			label = random.randint(2)
+			topic_words = evergreen_words if label == 1 else ephimeral_words
+			words = [random.choice(topic_words) if random.rand() < topic_fraction else common_words[min(int(random.zipf(1.3)) - 1, len(common_words) - 1)]
+				for temp in range(words_per_document)]
+			sentences = [' '.join(words[start:start + 15]).capitalize() + '.' for start in range(0, words_per_document, 15)]
+			url = 'http://www.%s.com/%s/%s-%d.html' % (random.choice(['example', 'news', 'food', 'blog']), words[0], '-'.join(words[1:4]), first_urlid + document)
+			boilerplate = json.dumps({'title': None if document % 10 == 0 else ' '.join(words[:8]).title(), 'body': ' '.join(sentences), 'url': url.replace('http://', '').replace('/', ' ')})
+			row = [url, first_urlid + document, boilerplate]
+			writer.writerow(row + [label] if labelled else row)
+
+## timing
+def cpu_seconds():
+	usage = resource.getrusage(resource.RUSAGE_SELF)
+	return usage.ru_utime + usage.ru_stime
+
+# highest resident memory of this process, ru_maxrss is in kilobytes on linux and in bytes on mac os
+def peak_rss_mb():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+
+# adding counts to record, along with documents/tokens per second
+def add_values(record, **values):
+	for name, value in values.items():
+		record[name] = value
+		if name in ('documents', 'tokens') and record['wall_seconds'] > 0:
+			record[name + '_per_second'] = value / record['wall_seconds']
+
+# running function, appending record of its wall time, cpu time and memory (and values) to records, returns result of function
+def time_stage(records, name, function, **values):
+	start_wall, start_cpu = time.time(), cpu_seconds()
+	result = function()
+	record = OrderedDict([('stage', name), ('wall_seconds', time.time() - start_wall), ('cpu_seconds', cpu_seconds() - start_cpu), ('peak_rss_mb', peak_rss_mb())])
+	add_values(record, **values)
+	records.append(record)
+	return result
+
+# benchmarking main.py of path instead of main.py next to this file (used in worker processes only)
+def load_main(main_path):
+	global main
+	if main_path is not None:
+		main = imp.load_source('main', main_path)
+
+# same TF-IDF parameters as main.py
+def create_vectorizer():
+	return TfidfVectorizer(min_df=15, max_features=None, strip_accents='unicode', analyzer='word', ngram_range=(1, 2), use_idf=True, smooth_idf=True, sublinear_tf=True)
+
+# words of title, body and url which main.py stems for a page, after tokenizing and stopword removal
+def words_to_stem(url, boilerplate):
+	page = json.loads(boilerplate, strict=False)
+	words = []
+	for key in ('title', 'body'):
+		if page.get(key):
+			for sentence in main.preprocess_boilerplate(page[key], False, return_as_str=False):
+				words.extend(sentence)
+	return words + main.url_cleaner(url, False).split()
+
+## stages
+# timing stemming of words of every page of tsv files, returns recorded stage
+def benchmark_stemming(tsv_paths, suffix, main_path=None):
+	load_main(main_path)
+	words = []
+	for tsv_path in tsv_paths:
+		data = p.read_table(tsv_path)
+		words.extend(words_to_stem(url, boilerplate) for url, boilerplate in zip(data.iloc[:,0], data.iloc[:,2]))
+	records = []
+	time_stage(records, 'stemming' + suffix, lambda: [main.stemming(document, "WordNetLemmatizer") for document in words],
+		documents=len(words), tokens=sum(len(document) for document in words))
+	return records
+
+# timing every other stage on train and test tsv files, returns recorded stages
+def benchmark_pipeline(train_path, test_path, suffix, models, kernel_limit=5000, main_path=None):
+	load_main(main_path)
+	records = []
+	train_file, test_file = time_stage(records, 'loading' + suffix, lambda: (p.read_table(train_path), p.read_table(test_path)))
+	boilerplates = list(train_file.iloc[:,2]) + list(test_file.iloc[:,2])
+	urls = list(train_file.iloc[:,0]) + list(test_file.iloc[:,0])
+	y_train = np.array(train_file.iloc[:,-1]).astype(int)
+	add_values(records[-1], documents=len(boilerplates))
+
+	contents = time_stage(records, 'extract_content' + suffix, lambda: [main.extract_content(boilerplate, "WordNetLemmatizer") for boilerplate in boilerplates], documents=len(boilerplates))
+	add_values(records[-1], tokens=sum(len(title.split()) + len(body.split()) for title, body in contents))
+
+	x_urls = time_stage(records, 'url_cleaner' + suffix, lambda: [main.url_cleaner(url, "WordNetLemmatizer") for url in urls], documents=len(urls))
+	add_values(records[-1], tokens=sum(len(url.split()) for url in x_urls))
+
+	x_cummulative = [x_urls[temp] + ' ' + contents[temp][0] + ' ' + contents[temp][1] for temp in range(len(contents))]
+	x_train_cummulative, x_test_cummulative = x_cummulative[:len(y_train)], x_cummulative[len(y_train):]
+	high_frequency_words_to_ignore = time_stage(records, 'get_high_frequence_words' + suffix, lambda: set(main.get_high_frequence_words(x_train_cummulative, y_train)),
+		documents=len(x_train_cummulative))
+	x_train_cummulative = [' '.join(word for word in text.split() if word not in high_frequency_words_to_ignore) for text in x_train_cummulative]
+	x_test_cummulative = [' '.join(word for word in text.split() if word not in high_frequency_words_to_ignore) for text in x_test_cummulative]
+
+	vectorizer = create_vectorizer()
+	tfidf_x_train_cummulative, tfidf_x_test_cummulative = time_stage(records, 'create_TF_IDF' + suffix,
+		lambda: main.create_TF_IDF(x_train_cummulative, x_test_cummulative, vectorizer), documents=len(x_cummulative))
+	add_values(records[-1], nnz=tfidf_x_train_cummulative.nnz + tfidf_x_test_cummulative.nnz, vocabulary=len(vectorizer.vocabulary_))
+
+	for model in models:
+		if model == "kernel_svm" and len(y_train) > kernel_limit:
+			continue
+		time_stage(records, 'fit_train_and_test_data:' + model + suffix,
+			lambda: main.fit_train_and_test_data(tfidf_x_train_cummulative, tfidf_x_test_cummulative, y_train, model), documents=len(x_cummulative))
+	return records
+
+def run_stage_function(arguments):
+	function_name, function_arguments = arguments
+	return globals()[function_name](*function_arguments)
+
+# running function of this module in a new process, returns its result
+def run_in_new_process(function_name, *arguments):
+	pool = multiprocessing.Pool(1)
+	try:
+		return pool.apply(run_stage_function, ((function_name, arguments),))
+	finally:
+		pool.close()
+		pool.join()
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Times every stage of main.py on synthetic data of growing size")
+	parser.add_argument('--documents', default='500,2000,8000', help="comma separated numbers of train documents")
+	parser.add_argument('--words', default='100,500', help="comma separated numbers of words per document")
+	parser.add_argument('--models', default='logit,svm,naive,kernel_svm', help="comma separated models of fit_train_and_test_data")
+	parser.add_argument('--kernel-limit', type=int, default=5000, help="largest number of documents kernel_svm is run on")
+	parser.add_argument('--main-file', default=None, help="main.py to benchmark instead of the one next to this file, e.g. a baseline version")
+	parser.add_argument('--output', default='benchmark_results.json', help="json file to store results in")
+	parser.add_argument('--csv', default=None, help="csv file to store results in")
+	parser.add_argument('--baseline', default=None, help="results of an earlier run to compare with")
+	args = parser.parse_args()
+	main_path = os.path.abspath(args.main_file) if args.main_file is not None else None
+
+	results = main.PipelineMetrics()
+	work_dir = tempfile.mkdtemp(prefix='evergreen-benchmark-')
+	try:
+		for n_documents in [int(size) for size in args.documents.split(',')]:
+			for words_per_document in [int(size) for size in args.words.split(',')]:
+				print ("\nBenchmarking %d documents of %d words...		started at %s" % (n_documents, words_per_document, time.strftime("%H:%M:%S", time.localtime())))
+				suffix = '/n=%d/w=%d' % (n_documents, words_per_document)
+				train_path, test_path = os.path.join(work_dir, 'train.tsv'), os.path.join(work_dir, 'test.tsv')
+				write_synthetic_tsv(train_path, n_documents, words_per_document, True, 0, 0)
+				write_synthetic_tsv(test_path, max(1, n_documents / 4), words_per_document, False, n_documents, 1)
+				results.records.extend(run_in_new_process('benchmark_pipeline', train_path, test_path, suffix, args.models.split(','), args.kernel_limit, main_path))
+				results.records.extend(run_in_new_process('benchmark_stemming', [train_path, test_path], suffix, main_path))
+	finally:
+		shutil.rmtree(work_dir)
+
+	print "\nStages:\n", results.summary()
+	results.write_json(args.output, vars(args))
+	if args.csv is not None:
+		results.write_csv(args.csv)
+	if args.baseline is not None:
+		print "\nComparing with ", args.baseline
+		for stage, field, before, after in main.compare_metrics(args.baseline, args.output):
+			print "Regression in ", stage, field, ": ", before, " -> ", after
@@ -0,0 +1,82 @@
+import os, time, copy, shutil, tempfile, argparse, numpy as np
+from sklearn import metrics
+import main, benchmark
+
+## incremental training benchmark
+# Compares adding a batch of new pages to a model (main.IncrementalModel.update) against training a new model on all pages, on synthetic data of benchmark.py.
+# For every corpus size a model is trained on the corpus, then every batch size is added to a copy of it and timed, and a new model is trained on corpus + batch.
+# Both are scored on same held-out pages, reporting seconds and roc_auc of each: update time should follow batch size, retrain time corpus size.
+
+# returns labels and evergreen probabilities of pages of a labelled tsv file
+def score_tsv(model_state, tsv_path, work_dir):
+	spool_path = os.path.join(work_dir, 'held_out.txt')
+	main.spool_documents(tsv_path, spool_path, True)
+	y, predicted = [], []
+	for urlids, labels, texts in main.read_spool_chunks(spool_path):
+		y.extend(labels)
+		predicted.extend(model_state.predict_proba(texts))
+	return (np.array(y), np.array(predicted))
+
+# writing pages of both tsv files to path
+def concatenate_tsv(path, first_path, second_path):
+	with open(path, 'wb') as output:
+		for index, tsv_path in enumerate((first_path, second_path)):
+			with open(tsv_path, 'rb') as tsv_file:
+				header = tsv_file.readline()
+				if index == 0:
+					output.write(header)
+				shutil.copyfileobj(tsv_file, output)
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmarks incremental model updates against training on all pages")
+	parser.add_argument('--corpus', default='2000,8000', help="comma separated numbers of pages a model is first trained on")
+	parser.add_argument('--batches', default='100,500,2000', help="comma separated numbers of new pages added to it")
+	parser.add_argument('--words', type=int, default=200, help="words per page")
+	parser.add_argument('--topic-fraction', type=float, default=0.01, help="fraction of words of a page coming from words of its category, lower is harder to classify")
+	parser.add_argument('--held-out', type=int, default=2000, help="number of pages roc_auc is measured on")
+	parser.add_argument('--epochs', type=int, default=5, help="passes over pages when training on all pages")
+	parser.add_argument('--update-epochs', type=int, default=1, help="passes over new pages when updating")
+	parser.add_argument('--output', default=None, help="csv file to write results to")
+	args = parser.parse_args()
+
+	work_dir = tempfile.mkdtemp(prefix='evergreen-benchmark-')
+	try:
+		held_out_path = os.path.join(work_dir, 'held_out.tsv')
+		benchmark.write_synthetic_tsv(held_out_path, args.held_out, args.words, True, 10**8, 2, args.topic_fraction)
+		results = []
+		print "corpus,batch,update_seconds,retrain_seconds,update_roc_auc,retrain_roc_auc"
+		for n_corpus in [int(size) for size in args.corpus.split(',')]:
+			corpus_path = os.path.join(work_dir, 'corpus.tsv')
+			benchmark.write_synthetic_tsv(corpus_path, n_corpus, args.words, True, 0, 0, args.topic_fraction)
+			corpus_model = main.IncrementalModel()
+			corpus_model.update(corpus_path, epochs=args.epochs)
+
+			for n_batch in [int(size) for size in args.batches.split(',')]:
+				batch_path, all_path = os.path.join(work_dir, 'batch.tsv'), os.path.join(work_dir, 'all.tsv')
+				benchmark.write_synthetic_tsv(batch_path, n_batch, args.words, True, n_corpus, 1, args.topic_fraction)
+				concatenate_tsv(all_path, corpus_path, batch_path)
+
+				updated_model = copy.deepcopy(corpus_model)
+				start = time.time()
+				updated_model.update(batch_path, epochs=args.update_epochs)
+				update_seconds = time.time() - start
+
+				retrained_model = main.IncrementalModel()
+				start = time.time()
+				retrained_model.update(all_path, epochs=args.epochs)
+				retrain_seconds = time.time() - start
+
+				y, predicted = score_tsv(updated_model, held_out_path, work_dir)
+				update_auc = metrics.roc_auc_score(y, predicted)
+				y, predicted = score_tsv(retrained_model, held_out_path, work_dir)
+				retrain_auc = metrics.roc_auc_score(y, predicted)
+				results.append((n_corpus, n_batch, update_seconds, retrain_seconds, update_auc, retrain_auc))
+				print "%d,%d,%.3f,%.3f,%.4f,%.4f" % results[-1]
+	finally:
+		shutil.rmtree(work_dir)
+
+	if args.output is not None:
+		with open(args.output, 'wb') as output:
+			output.write("corpus,batch,update_seconds,retrain_seconds,update_roc_auc,retrain_roc_auc\n")
+			for result in results:
+				output.write("%d,%d,%.3f,%.3f,%.4f,%.4f\n" % result)
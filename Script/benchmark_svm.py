@@ -0,0 +1,70 @@
+import os, time, shutil, tempfile, argparse, numpy as np, pandas as p
+from sklearn import metrics, cross_validation
+import main, benchmark
+
+## SVM benchmark
+# Compares "svm" (LinearSVC with sigmoid calibration) against "kernel_svm" (SVC with probability=True) of main.fit_train_and_test_data()
+# on TF-IDF matrices of increasing size, reporting training + prediction time and held-out roc_auc of each.
+# Matrices are made by the same pipeline as main.py (extract_content, url_cleaner, high frequency words, create_TF_IDF),
+# from labelled pages of --data (e.g. ../data/train.tsv) if given, synthetic pages of benchmark.py otherwise.
+# Kernel SVC is skipped above --kernel-limit documents, as its training time grows faster than number of documents.
+
+# returns TF-IDF matrix and labels of first n_documents pages of labelled tsv file
+def pipeline_tf_idf(tsv_path, n_documents, workers=1):
+	data = p.read_table(tsv_path, nrows=n_documents)
+	titles, bodies = main.preprocess_boilerplates(list(data.iloc[:,2]), "WordNetLemmatizer", workers)
+	urls = main.preprocess_urls(list(data.iloc[:,0]), "WordNetLemmatizer", workers)
+	y = np.array(data.iloc[:,-1]).astype(int)
+	texts = [urls[temp] + ' ' + titles[temp] + ' ' + bodies[temp] for temp in range(len(urls))]
+	high_frequency_words = main.CorpusStatistics(texts, y).high_frequency_words()
+	tf_idf, empty = main.create_TF_IDF(texts, [], main.create_tf_idf_parameters(), high_frequency_words)
+	return (tf_idf, y)
+
+# fitting model on train part and scoring held-out part, returns (seconds, roc_auc)
+def time_model(model, train_data, test_data, y_train_data, y_test_data):
+	start = time.time()
+	estimator = main.create_svm_parameters(model == "kernel_svm")
+	estimator.fit(train_data, y_train_data)
+	predicted = estimator.predict_proba(test_data)[:,1]
+	return (time.time() - start, metrics.roc_auc_score(y_test_data, predicted))
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmarks linear and kernel SVM on TF-IDF data of main.py pipeline")
+	parser.add_argument('--sizes', default='2000,5000,20000,100000', help="comma separated numbers of documents")
+	parser.add_argument('--data', default=None, help="labelled tsv file to take pages from (sizes above its number of pages are cut to it), synthetic pages are used if not given")
+	parser.add_argument('--words', type=int, default=300, help="words per synthetic page")
+	parser.add_argument('--topic-fraction', type=float, default=0.02, help="fraction of words of a synthetic page coming from words of its category, lower is harder to classify")
+	parser.add_argument('--workers', type=int, default=1, help="number of preprocessing processes (0 = one per cpu core)")
+	parser.add_argument('--kernel-limit', type=int, default=20000, help="largest number of documents kernel SVC is run on")
+	parser.add_argument('--output', default=None, help="csv file to write results to")
+	args = parser.parse_args()
+
+	work_dir = tempfile.mkdtemp(prefix='evergreen-benchmark-')
+	try:
+		results = []
+		print "documents,model,seconds,roc_auc,speedup"
+		for n_documents in [int(size) for size in args.sizes.split(',')]:
+			tsv_path = args.data
+			if tsv_path is None:
+				tsv_path = os.path.join(work_dir, 'pages.tsv')
+				benchmark.write_synthetic_tsv(tsv_path, n_documents, args.words, True, 0, 0, args.topic_fraction)
+			tf_idf, y = pipeline_tf_idf(tsv_path, n_documents, args.workers)
+			n_documents = tf_idf.shape[0]
+			train_data, test_data, y_train_data, y_test_data = cross_validation.train_test_split(tf_idf, y, test_size=0.2, random_state=0)
+			linear_seconds, linear_auc = time_model("svm", train_data, test_data, y_train_data, y_test_data)
+			if n_documents <= args.kernel_limit:
+				kernel_seconds, kernel_auc = time_model("kernel_svm", train_data, test_data, y_train_data, y_test_data)
+				results.append((n_documents, "kernel_svm", kernel_seconds, kernel_auc, 1.0))
+				results.append((n_documents, "svm", linear_seconds, linear_auc, kernel_seconds / linear_seconds))
+			else:
+				results.append((n_documents, "svm", linear_seconds, linear_auc, float('nan')))
+			for result in results[-2 if n_documents <= args.kernel_limit else -1:]:
+				print "%d,%s,%.3f,%.4f,%.1f" % result
+	finally:
+		shutil.rmtree(work_dir)
+
+	if args.output is not None:
+		with open(args.output, 'wb') as output:
+			output.write("documents,model,seconds,roc_auc,speedup\n")
+			for result in results:
+				output.write("%d,%s,%.3f,%.4f,%.1f\n" % result)
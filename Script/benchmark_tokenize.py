@@ -0,0 +1,69 @@
+import re, json, time, argparse, numpy as np, pandas as p
+from nltk.tokenize import word_tokenize, sent_tokenize
+from nltk.corpus import stopwords
+import main
+
+## tokenizing benchmark
+# Measures words per second of preprocess_boilerplate() and url_cleaner() against their previous implementation (kept below as reference),
+# and checks that both give the same words for every document.
+# Documents are boilerplate of ../data/train.tsv if given with --data, synthetic pages otherwise.
+
+# previous preprocess_boilerplate(): sentence by sentence, stopwords list loaded for every word
+def reference_preprocess_boilerplate(str, stemmer_type=False):
+	temp_list = []
+	sentences=[word_tokenize(" ".join(re.findall(r'\w+', t,flags = re.UNICODE | re.LOCALE)).lower()) for t in sent_tokenize(str.replace("'", ""))]
+	for sentence in sentences:
+		words = [w for w in sentence if w.lower() not in stopwords.words('english')]
+		temp_list.append(" ".join(main.stemming(words, stemmer_type)))
+	return " ".join(temp_list)
+
+# previous url_cleaner()
+def reference_url_cleaner(url, stemmer_type=False, strip_list=main.url_strip_list):
+	url_list=[x for x in word_tokenize(" ".join(re.findall(r'\w+', url, flags = re.UNICODE | re.LOCALE)).lower()) if x not in strip_list and not x.isdigit() and x not in stopwords.words('english')]
+	return " ".join(main.stemming(url_list, stemmer_type))
+
+# creating n_documents pages of sentences made of common and rare words, stopwords, numbers, punctuation and contractions
+def synthetic_pages(n_documents, words_per_document=300, random_state=0):
+	random = np.random.RandomState(random_state)
+	vocabulary = ['recipe', 'chicken', 'health', 'news', 'election', 'fashion', 'photos', 'sports', 'cannot', 'gonna', "don't", "it's",
+		'the', 'and', 'of', 'to', 'in', 'for', 'with', 'about', '2012', '10', 'U.S.', 'e-mail', 'Home', 'Video'] + ['word%d' % i for i in range(2000)]
+	pages = []
+	urls = []
+	for document in range(n_documents):
+		words = random.choice(vocabulary, size=words_per_document)
+		sentences = [' '.join(words[start:start + 12]).capitalize() + random.choice(['.', '!', '?', ',', ' --']) for start in range(0, words_per_document, 12)]
+		pages.append(' '.join(sentences))
+		urls.append('http://www.example.com/%s/%s-%d.html' % (words[0], '-'.join(words[1:5]), document))
+	return (pages, urls)
+
+# timing function on every text, returns words per second, seconds and results
+def words_per_second(function, texts, stemmer_type):
+	start = time.time()
+	results = [function(text, stemmer_type) for text in texts]
+	seconds = time.time() - start
+	return (sum(len(result.split()) for result in results) / seconds, seconds, results)
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmarks tokenizing of boilerplate and urls")
+	parser.add_argument('--data', default=None, help="tsv file to take documents from, synthetic pages are used if not given")
+	parser.add_argument('--documents', type=int, default=1000, help="number of documents")
+	parser.add_argument('--stemmer', default=False, help="stemmer type (PorterStemmer, WordNetLemmatizer), not used by default to time tokenizing only")
+	args = parser.parse_args()
+
+	if args.data is not None:
+		data = p.read_table(args.data, nrows=args.documents)
+		pages = []
+		for boilerplate in data.iloc[:,2]:
+			page = json.loads(boilerplate, strict=False)
+			pages.append((page.get('title') or '') + ' ' + (page.get('body') or ''))
+		urls = list(data.iloc[:,0])
+	else:
+		pages, urls = synthetic_pages(args.documents)
+
+	for name, reference, fast, texts in (("boilerplate", reference_preprocess_boilerplate, main.preprocess_boilerplate, pages),
+										("url", reference_url_cleaner, main.url_cleaner, urls)):
+		before, before_seconds, expected = words_per_second(reference, texts, args.stemmer)
+		after, after_seconds, results = words_per_second(fast, texts, args.stemmer)
+		different = sum(1 for temp in range(len(texts)) if expected[temp].split() != results[temp].split())
+		print "%s: before %.0f words/s (%.2f s), after %.0f words/s (%.2f s), speedup %.1f, documents with different words: %d" % (
+			name, before, before_seconds, after, after_seconds, after / before, different)
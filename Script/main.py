@@ -1,165 +1,756 @@
-import time, re, ast, numpy as np, pandas as p, cPickle as pickle
-from sklearn import metrics,preprocessing,cross_validation
-from sklearn.feature_extraction.text import TfidfVectorizer
+import os, sys, csv, copy, time, re, ast, json, glob, shutil, resource, cProfile, contextlib, hashlib, tempfile, argparse, multiprocessing, numpy as np, pandas as p, cPickle as pickle
+import scipy.sparse as sp
+from sklearn import metrics,preprocessing,cross_validation,grid_search
+from sklearn.base import clone
+from sklearn.externals.joblib import Parallel, delayed
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer, CountVectorizer, strip_accents_unicode, strip_accents_ascii
 import sklearn.linear_model as lm
 import sklearn.svm as svm
+from sklearn.calibration import CalibratedClassifierCV
 import sklearn.naive_bayes as naive
 from nltk import clean_html, SnowballStemmer, PorterStemmer
 from nltk.stem import WordNetLemmatizer
 from nltk.tokenize import word_tokenize, sent_tokenize
 from nltk.corpus import stopwords
-
-print ('Starting at '+time.strftime("%H:%M:%S", time.localtime())+'  ...')
+from collections import OrderedDict, Counter
+from json.decoder import scanstring
 
 ## preprocessing 
+# Memoized token -> stem/lemma table shared by title, body and url preprocessing
+# web boilerplate repeats a small set of words many times, so every word is stemmed once and looked up afterwards
+# table is a bounded LRU (least recently used word is dropped once max_size is reached) and can be saved to and loaded from disk
+class LemmaTable(object):
+	def __init__(self, max_size=500000):
+		self.max_size = max_size
+		self.table = OrderedDict() # (stemmer type, encoding, word) -> stemmed word
+		self.stemmers = {} # one stemmer object per type, created on first use
+		self.added = [] # keys added since last flush(), sent back from worker processes
+		self.hits = 0
+		self.misses = 0
+		self.miss_time = 0.0 # seconds spent stemming words not present in table
+
+	def stemmer(self, type):
+		if type not in self.stemmers:
+			if type == "PorterStemmer":
+				#calling PorterStemmer
+				self.stemmers[type] = PorterStemmer().stem
+			elif type == "WordNetLemmatizer":
+				#calling WordNetLemmatizer
+				self.stemmers[type] = WordNetLemmatizer().lemmatize
+		return self.stemmers[type]
+
+	def lookup(self, word, type, encoding="utf8"):
+		key = (type, encoding, word)
+		if key in self.table:
+			# moving word to the most recently used end
+			value = self.table.pop(key)
+			self.table[key] = value
+			self.hits += 1
+			return value
+		start = time.time()
+		value = self.stemmer(type)(word).encode(encoding)
+		self.miss_time += time.time() - start
+		self.misses += 1
+		self.insert(key, value)
+		self.added.append(key)
+		return value
+
+	def insert(self, key, value):
+		if key in self.table:
+			del self.table[key]
+		self.table[key] = value
+		if len(self.table) > self.max_size:
+			self.table.popitem(last=False)
+
+	# returns words added and counters collected since last flush, and resets them
+	# used by worker processes to send their part of the table back to main process, which merge()s it
+	def flush(self):
+		delta = ([(key, self.table[key]) for key in self.added if key in self.table], self.hits, self.misses, self.miss_time)
+		self.added = []
+		self.hits = 0
+		self.misses = 0
+		self.miss_time = 0.0
+		return delta
+
+	def merge(self, delta):
+		entries, hits, misses, miss_time = delta
+		for key, value in entries:
+			self.insert(key, value)
+		self.hits += hits
+		self.misses += misses
+		self.miss_time += miss_time
+
+	# returns hit rate and estimated seconds saved (hits times average time of stemming a word)
+	def stats(self):
+		lookups = self.hits + self.misses
+		hit_rate = self.hits / (1.0 * lookups) if lookups else 0.0
+		time_saved = self.hits * self.miss_time / self.misses if self.misses else 0.0
+		return (hit_rate, time_saved)
+
+	def save(self, path):
+		with open(path, 'wb') as table_file:
+			pickle.dump(self.table.items(), table_file, pickle.HIGHEST_PROTOCOL)
+
+	def load(self, path):
+		with open(path, 'rb') as table_file:
+			for key, value in pickle.load(table_file):
+				self.insert(key, value)
+
+lemma_table = LemmaTable()
+
 # We have used two methods to preprocess boilerplate and url of example, namely Stemming and Lemmatization
 def stemming(words_l, type="PorterStemmer", lang="english", encoding="utf8"):
 	supported_stemmers = ["PorterStemmer","WordNetLemmatizer"]
 	if type is False or type not in supported_stemmers:
 		return words_l
 	else:
-		temp_list = []
-		if type == "PorterStemmer": 
-			#calling PorterStemmer
-			stemmer = PorterStemmer()
-			for word in words_l:
-				temp_list.append(stemmer.stem(word).encode(encoding))
-		if type == "WordNetLemmatizer":
-			#calling WordNetLemmatizer
-			wnl = WordNetLemmatizer()
-			for word in words_l:
-				temp_list.append(wnl.lemmatize(word).encode(encoding))
-		return temp_list
+		return [lemma_table.lookup(word, type, encoding) for word in words_l]
+
+## tokenizing
+# Regular expressions and word sets are built once instead of on every word.
+# word_tokenize() on space separated \w+ words only splits the few contractions below (e.g. "cannot" -> "can", "not"),
+# so words are taken directly from word_regex and word_tokenize() is called only on words containing one of them.
+word_regex = re.compile(r'\w+', flags = re.UNICODE | re.LOCALE)
+contraction_regex = re.compile(r'cannot|gimme|gonna|gotta|lemme|wanna', flags = re.IGNORECASE)
+
+# english stopwords as frozenset, loaded from nltk on first use
+english_stopwords = None
+def get_stopwords():
+	global english_stopwords
+	if english_stopwords is None:
+		english_stopwords = frozenset(stopwords.words('english'))
+	return english_stopwords
+
+# splitting text into lowercase words, same words as word_tokenize(" ".join(re.findall(r'\w+', text)).lower())
+def tokenize_words(text):
+	words = []
+	for word in word_regex.findall(text):
+		word = word.lower()
+		if contraction_regex.search(word) is None:
+			words.append(word)
+		else:
+			words.extend(word_tokenize(word))
+	return words
 
 # String and tokenize
+# whole text is tokenized in a single pass when result is returned as string, as splitting into sentences does not change words
 def preprocess_boilerplate(str, stemmer_type="WordNetLemmatizer", lang="english", return_as_str=True, 
 						do_remove_stopwords=True):
-	temp_list = []
-	words = []
-	
 	# Tokenizing
 	# Tokenizers divide strings into lists of substrings.  For example, tokenizers can be used to find the words and punctuation in a string.
-	sentences=[word_tokenize(" ".join(re.findall(r'\w+', t,flags = re.UNICODE | re.LOCALE)).lower()) for t in sent_tokenize(str.replace("'", ""))]
-	
-	for sentence in sentences:
+	if return_as_str:
+		sentences = [tokenize_words(str.replace("'", ""))]
+	else:
+		sentences = [tokenize_words(t) for t in sent_tokenize(str.replace("'", ""))]
+
+	temp_list = []
+	for words in sentences:
 		# Remove stopwords
 		if do_remove_stopwords:
 			#Stopwords usually have little lexical content, and their presence in a text fails to distinguish it from other texts.
 			#examples: 'for', 'with', 'about', 'against', 'between', 'into', 'through', 'during', 'before', 'after'
-			words = [w for w in sentence if w.lower() not in stopwords.words('english')]
-		else:
-			words = sentence
+			english_stopwords = get_stopwords()
+			words = [w for w in words if w not in english_stopwords]
 		# Stemming
-		words = stemming(words, stemmer_type)
-		
-		# Convert to string
-		if return_as_str:
-			temp_list.append(" ".join(words))
-		else:
-			temp_list.append(words)
+		temp_list.append(stemming(words, stemmer_type))
+
 	if return_as_str:
-		return " ".join(temp_list)
+		return " ".join(temp_list[0])
 	else:
 		return temp_list
 
+# words carrying no information about the page itself, removed from every url
+url_strip_list=['http', 'https', 'www', 'com', 'net', 'org', 'm', 'html', 'htm']
+url_strip_set=frozenset(url_strip_list)
+
 # url cleaner (used to remove stop words, digits, etc), and then stemming function is called for further processing
-def url_cleaner(url, stemmer_type="WordNetLemmatizer"):
-	strip_list=['http', 'https', 'www', 'com', 'net', 'org', 'm', 'html', 'htm']
-	url_list=[x for x in word_tokenize(" ".join(re.findall(r'\w+', url, flags = re.UNICODE | re.LOCALE)).lower()) if x not in strip_list and not x.isdigit() and x not in stopwords.words('english')]
+def url_cleaner(url, stemmer_type="WordNetLemmatizer", strip_list=url_strip_list):
+	strip_set = url_strip_set if strip_list is url_strip_list else frozenset(strip_list)
+	english_stopwords = get_stopwords()
+	url_list=[x for x in tokenize_words(url) if x not in strip_set and not x.isdigit() and x not in english_stopwords]
 	return " ".join(stemming(url_list, stemmer_type))
 
+## boilerplate decoding
+# Boilerplate is a json object like {"title": "...", "body": "...", "url": "..."}, with null for missing values.
+# It is read in one pass with the C string scanner of json module: only values of wanted keys are decoded, other values are skipped.
+# Boilerplate which is not valid json is read again with ast.literal_eval (as it was before), only if that fails too it is malformed.
+# Malformed boilerplate is counted (with a few examples kept for the report) and gives no values, instead of stopping the run.
+# Strings are read with strict=False, so that raw control characters (tabs, form feeds) inside strings are kept as ast.literal_eval did.
+json_decoder = json.JSONDecoder(strict=False)
+json_whitespace_regex = re.compile(r'[ \t\n\r]*')
+json_literal_names = {'null': 'None', 'true': 'True', 'false': 'False'}
+
+class BoilerplateDecoder(object):
+	def __init__(self, keys=('title', 'body'), max_examples=5):
+		self.keys = frozenset(keys)
+		self.max_examples = max_examples
+		self.malformed = 0
+		self.examples = []
+
+	# returns dict of wanted keys having string values, raises ValueError if text is not a json object
+	def parse(self, text):
+		index = json_whitespace_regex.match(text, 0).end()
+		if text[index:index + 1] != '{':
+			raise ValueError("boilerplate is not a json object")
+		index = json_whitespace_regex.match(text, index + 1).end()
+		values = {}
+		if text[index:index + 1] == '}':
+			return values
+		while True:
+			if text[index:index + 1] != '"':
+				raise ValueError("expected key at position %d" % index)
+			key, index = scanstring(text, index + 1, None, False)
+			index = json_whitespace_regex.match(text, index).end()
+			if text[index:index + 1] != ':':
+				raise ValueError("expected ':' at position %d" % index)
+			index = json_whitespace_regex.match(text, index + 1).end()
+			if text[index:index + 1] == '"':
+				value, index = scanstring(text, index + 1, None, False)
+				if key in self.keys:
+					values[key] = value
+			else:
+				# null, number, list or object, never used as title or body
+				value, index = json_decoder.raw_decode(text, index)
+			index = json_whitespace_regex.match(text, index).end()
+			if text[index:index + 1] == ',':
+				index = json_whitespace_regex.match(text, index + 1).end()
+			elif text[index:index + 1] == '}':
+				return values
+			else:
+				raise ValueError("expected ',' or '}' at position %d" % index)
+
+	# slower path for boilerplate which is not strict json but was read by ast.literal_eval before, e.g. with python escapes like \'
+	# json names null, true and false are renamed in the syntax tree, not in the text, so that strings are never changed
+	def parse_literal(self, text):
+		tree = ast.parse(text.strip(), mode='eval')
+		for node in ast.walk(tree):
+			if isinstance(node, ast.Name) and node.id in json_literal_names:
+				node.id = json_literal_names[node.id]
+		content = ast.literal_eval(tree)
+		if not isinstance(content, dict):
+			raise ValueError("boilerplate is not a json object")
+		values = {}
+		for key in self.keys:
+			value = content.get(key)
+			if isinstance(value, str):
+				value = value.decode('utf8', 'replace')
+			if isinstance(value, unicode):
+				values[key] = value
+		return values
+
+	def decode(self, text):
+		try:
+			return self.parse(text)
+		except (ValueError, TypeError) as error:
+			try:
+				return self.parse_literal(text)
+			except (ValueError, TypeError, SyntaxError, AttributeError):
+				pass
+			# TypeError is raised for missing boilerplate, read by pandas as float nan
+			self.malformed += 1
+			if len(self.examples) < self.max_examples:
+				self.examples.append("%s: %r" % (error, text[:80] if isinstance(text, basestring) else text))
+			return {}
+
+	# returns counters collected since last flush and resets them, merged into main process like LemmaTable
+	def flush(self):
+		delta = (self.malformed, self.examples)
+		self.malformed = 0
+		self.examples = []
+		return delta
+
+	def merge(self, delta):
+		malformed, examples = delta
+		self.malformed += malformed
+		self.examples.extend(examples[:self.max_examples - len(self.examples)])
+
+boilerplate_decoder = BoilerplateDecoder()
+
 # extracting content of the page
 def extract_content(str, stemmer_type="WordNetLemmatizer"):
-	# Adjusting 'null' and extracting json
+	# extracting title and body from json, null or malformed values are treated as missing
+	content = boilerplate_decoder.decode(str)
 
-	#The "str" provided as function argument is filtered to contain only following Python literal structures: strings, numbers, tuples, lists, dicts, booleans, and None
-	# Done for safely evaluating strings containing Python values from untrusted sources without the need to parse the values oneself. 
-	try:
-		json=ast.literal_eval(str)
-	except ValueError:
-		json=ast.literal_eval(str.replace('null', '"null"'))
-
-	if ('body' in json and 'title' in json):
-		return (preprocess_boilerplate(json['title'], stemmer_type), preprocess_boilerplate(json['body'], stemmer_type))
-	elif ('body' in json):
-		return ("", preprocess_boilerplate(json['body'], stemmer_type))
-	elif ('title' in json):
-		return (preprocess_boilerplate(json['title'], stemmer_type), "")
+	if ('body' in content and 'title' in content):
+		return (preprocess_boilerplate(content['title'], stemmer_type), preprocess_boilerplate(content['body'], stemmer_type))
+	elif ('body' in content):
+		return ("", preprocess_boilerplate(content['body'], stemmer_type))
+	elif ('title' in content):
+		return (preprocess_boilerplate(content['title'], stemmer_type), "")
 	else:
 		return ("", "")
 
+# state collected by a task (words added to lemma_table, malformed boilerplate), sent back from worker processes
+def flush_task_state():
+	return (lemma_table.flush(), boilerplate_decoder.flush())
+
+def merge_task_state(state):
+	lemma_table.merge(state[0])
+	boilerplate_decoder.merge(state[1])
+
+# task wrappers used by parallel_map, they are kept at module level so that multiprocessing can pickle them
+# every task is a (list of data, stemmer_type) tuple, result is preprocessed list along with state collected by the task
+def extract_content_task(task):
+	return ([extract_content(data, task[1]) for data in task[0]], flush_task_state())
+
+def url_cleaner_task(task):
+	return ([url_cleaner(url, task[1]) for url in task[0]], flush_task_state())
+
+# splits data into tasks of chunksize documents, runs them and puts results back in order
+# state collected in worker processes is merged into this process
+#	pool, if given, is a pool made by create_pool() which is used instead of starting a new one
+def preprocess_chunks(task_function, data, stemmer_type, workers, chunksize, pool=None):
+	tasks = [(data[start:start + chunksize], stemmer_type) for start in range(0, len(data), chunksize)]
+	# counters are taken out before worker processes are forked, so that they are not reported back twice
+	own_state = flush_task_state()
+	results = []
+	for chunk_results, task_state in parallel_map(task_function, tasks, workers, 1, pool):
+		results.extend(chunk_results)
+		merge_task_state(task_state)
+	merge_task_state(own_state)
+	return results
+
+# applies function to every item, either serially or spread across a pool of worker processes
+# Pool.map hands out items in chunks of chunksize and returns results in input order, so the output is the same as the serial path
+#	workers is set to 1 to run in this process, 0 to use one process per cpu core
+#	pool is a pool made by create_pool(), kept open by the caller across calls, a new pool is started and closed otherwise
+def parallel_map(function, items, workers=1, chunksize=100, pool=None):
+	if pool is not None and len(items) > 1:
+		return pool.map(function, items, chunksize)
+	if workers == 0:
+		workers = multiprocessing.cpu_count()
+	if workers <= 1 or len(items) <= 1:
+		return [function(item) for item in items]
+	pool = multiprocessing.Pool(processes=workers)
+	try:
+		return pool.map(function, items, chunksize)
+	finally:
+		pool.close()
+		pool.join()
+
+# starting a pool of worker processes to be shared by many parallel_map() calls, returns None if work is done in this process
+# state of this process is taken out while workers are forked, so that workers do not report it back as their own
+def create_pool(workers=1):
+	if workers == 0:
+		workers = multiprocessing.cpu_count()
+	if workers <= 1:
+		return None
+	own_state = flush_task_state()
+	pool = multiprocessing.Pool(processes=workers)
+	merge_task_state(own_state)
+	return pool
+
+# preprocessing boilerplate of every document, returns list of titles and list of bodies
+def preprocess_boilerplates(boilerplates, stemmer_type="WordNetLemmatizer", workers=1, chunksize=100, pool=None):
+	contents = preprocess_chunks(extract_content_task, boilerplates, stemmer_type, workers, chunksize, pool)
+	return ([title for title, body in contents], [body for title, body in contents])
+
+# preprocessing url of every document
+def preprocess_urls(urls, stemmer_type="WordNetLemmatizer", workers=1, chunksize=100, pool=None):
+	return preprocess_chunks(url_cleaner_task, urls, stemmer_type, workers, chunksize, pool)
+
+## metrics
+# Every stage of a run is recorded with its wall time, cpu time (including finished worker processes), memory and counts:
+#	documents and tokens processed (and docs_per_second, tokens_per_second), and for matrices nnz and vocabulary size, added with annotate()
+# peak_rss_mb is the highest resident memory of this process up to end of the stage, children_peak_rss_mb the same for worker processes.
+# Stages named in profile_stages are run under cProfile, and their statistics are saved to profile_dir/profile_<stage>.prof
+class PipelineMetrics(object):
+	def __init__(self):
+		self.records = []
+		self.profile_stages = frozenset()
+		self.profile_dir = '.'
+
+	@contextlib.contextmanager
+	def stage(self, name, **values):
+		record = OrderedDict([('stage', name)])
+		self.records.append(record)
+		profiler = cProfile.Profile() if name in self.profile_stages else None
+		start_wall, start_cpu = time.time(), self.cpu_seconds()
+		if profiler is not None:
+			profiler.enable()
+		try:
+			yield record
+		finally:
+			if profiler is not None:
+				profiler.disable()
+				profiler.dump_stats(os.path.join(self.profile_dir, 'profile_' + name + '.prof'))
+			record['wall_seconds'] = time.time() - start_wall
+			record['cpu_seconds'] = self.cpu_seconds() - start_cpu
+			record['rss_mb'] = self.rss_mb()
+			record['peak_rss_mb'] = self.peak_rss_mb(resource.RUSAGE_SELF)
+			record['children_peak_rss_mb'] = self.peak_rss_mb(resource.RUSAGE_CHILDREN)
+			self.update(record, values)
+
+	# adding counts to last record of stage, for counts only known after the stage (e.g. tokens of preprocessed text)
+	def annotate(self, name, **values):
+		for record in reversed(self.records):
+			if record['stage'] == name:
+				self.update(record, values)
+				return
+
+	def update(self, record, values):
+		record.update(values)
+		if 'wall_seconds' in record and record['wall_seconds'] > 0:
+			for count in ('documents', 'tokens'):
+				if count in record:
+					record[count + '_per_second'] = record[count] / record['wall_seconds']
+
+	def cpu_seconds(self):
+		own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+		return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+	# highest resident memory of this process (RUSAGE_SELF) or of finished worker processes (RUSAGE_CHILDREN)
+	# ru_maxrss is in kilobytes on linux and in bytes on mac os
+	def peak_rss_mb(self, who):
+		return resource.getrusage(who).ru_maxrss / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+
+	# current resident memory, read from /proc (linux only, None elsewhere)
+	def rss_mb(self):
+		try:
+			with open('/proc/self/statm') as statm:
+				return int(statm.read().split()[1]) * resource.getpagesize() / (1024.0 * 1024.0)
+		except (IOError, IndexError, ValueError):
+			return None
+
+	def write_json(self, path, arguments=None):
+		with open(path, 'wb') as metrics_file:
+			json.dump({'started': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()), 'arguments': arguments, 'stages': self.records}, metrics_file, indent=1)
+
+	def write_csv(self, path):
+		columns = []
+		for record in self.records:
+			columns.extend(column for column in record if column not in columns)
+		with open(path, 'wb') as metrics_file:
+			writer = csv.DictWriter(metrics_file, columns)
+			writer.writeheader()
+			writer.writerows(self.records)
+
+	def summary(self):
+		return '\n'.join("%-20s %8.2f s wall %8.2f s cpu %8.1f MB peak" % (record['stage'], record['wall_seconds'], record['cpu_seconds'], record['peak_rss_mb'])
+			for record in self.records if 'wall_seconds' in record)
+
+metrics = PipelineMetrics()
+
+# comparing two runs written by PipelineMetrics.write_json(), stages are matched by name and order of occurrence
+# a stage is a regression if its wall time, cpu time or peak memory grew by more than tolerance (fraction) and more than minimum_change (seconds or MB)
+# returns list of (stage, field, baseline value, current value) regressions
+def compare_metrics(baseline_path, current_path, tolerance=0.1, minimum_change=0.05):
+	runs = []
+	for path in (baseline_path, current_path):
+		with open(path, 'rb') as metrics_file:
+			occurrences = Counter()
+			# stages are kept in order of the file, so that the report follows the run
+			stages = OrderedDict()
+			for record in json.load(metrics_file)['stages']:
+				occurrences[record['stage']] += 1
+				stages[(record['stage'], occurrences[record['stage']])] = record
+			runs.append(stages)
+	baseline, current = runs
+
+	regressions = []
+	for key in current:
+		if key not in baseline:
+			continue
+		for field in ('wall_seconds', 'cpu_seconds', 'peak_rss_mb'):
+			before, after = baseline[key].get(field), current[key].get(field)
+			if before is None or after is None:
+				continue
+			print "%-20s %-14s %10.2f -> %10.2f" % (key[0], field, before, after)
+			if after > before * (1 + tolerance) and after - before > minimum_change:
+				regressions.append((key[0], field, before, after))
+	return regressions
+
+## caching
+# Every stage of preprocessing is stored in cache_dir as "<stage>-<key>.p", where key is a sha1 of the stage inputs.
+# Inputs of a stage are the raw tsv rows (through their hash) or the key of the stage it depends on, plus the parameters of the stage,
+# so changing data or any parameter gives a new key and the old entry is never read again.
+
+# hashing the rows of input data, returns hex digest
+def hash_rows(rows, encoding="utf8"):
+	digest = hashlib.sha1()
+	for row in rows:
+		if isinstance(row, unicode):
+			row = row.encode(encoding)
+		digest.update(str(row))
+		digest.update('\0')
+	return digest.hexdigest()
+
+# combining keys of previous stages and parameters of a stage into the key of that stage
+def cache_key(*parts):
+	return hashlib.sha1(repr(parts)).hexdigest()
+
+# loads stage from cache_dir if an entry with given key exists, otherwise calls compute() and stores its result
+# entries of the same stage with another key are stale, only the newest keep entries of every stage are kept on disk
+# every stage is recorded in metrics, whether it is computed or loaded
+def cached_stage(cache_dir, stage, key, compute, keep=1):
+	with metrics.stage(stage) as record:
+		record['cache_hit'] = False
+		if cache_dir is None:
+			return compute()
+		path = os.path.join(cache_dir, stage + '-' + key + '.p')
+		if os.path.exists(path):
+			print ("\nLoading "+stage+" from cache...		started at "+time.strftime("%H:%M:%S", time.localtime()))
+			record['cache_hit'] = True
+			# marking entry as recently used, eviction goes by modification time
+			os.utime(path, None)
+			with open(path, 'rb') as cache_file:
+				return pickle.load(cache_file)
+
+		result = compute()
+		store_cached_stage(cache_dir, stage, path, result, keep)
+		return result
+
+# writing result of a stage to its cache entry path, and evicting stale entries of the stage
+def store_cached_stage(cache_dir, stage, path, result, keep=1):
+	if not os.path.isdir(cache_dir):
+		os.makedirs(cache_dir)
+	# writing to a temporary file first, so an interrupted run never leaves a truncated entry behind
+	with open(path + '.tmp', 'wb') as cache_file:
+		pickle.dump(result, cache_file, pickle.HIGHEST_PROTOCOL)
+	os.rename(path + '.tmp', path)
+
+	# evicting stale entries of this stage
+	entries = sorted(glob.glob(os.path.join(cache_dir, stage + '-*.p')), key=os.path.getmtime, reverse=True)
+	for entry in entries[max(keep, 1):]:
+		if entry != path:
+			os.remove(entry)
+
+## model bundle
+# Everything needed to score a new page is saved in one pickle, loaded by score.py:
+# preprocessing parameters, fitted vectorizer, high frequency words, feature selector (or None), classifier and the word -> lemma table
+# values given as keyword arguments are saved along with them
+def save_model_bundle(path, vectorizer, high_frequency_words, feature_selector, classifier, stemmer_type="WordNetLemmatizer", **values):
+	bundle = {
+		'stemmer_type': stemmer_type,
+		'url_strip_list': url_strip_list,
+		'vectorizer': vectorizer,
+		'high_frequency_words': frozenset(high_frequency_words),
+		'feature_selector': feature_selector,
+		'classifier': classifier,
+		'lemmas': lemma_table.table.items(),
+	}
+	bundle.update(values)
+	with open(path + '.tmp', 'wb') as bundle_file:
+		pickle.dump(bundle, bundle_file, pickle.HIGHEST_PROTOCOL)
+	os.rename(path + '.tmp', path)
+
+# classes of this file pickled while it runs as a script (python main.py) are saved as __main__.<class>, they are looked up here instead,
+# so that bundles can be loaded from any module importing main
+def find_pipeline_class(module_name, class_name):
+	if module_name == '__main__':
+		return getattr(sys.modules[__name__], class_name)
+	__import__(module_name)
+	return getattr(sys.modules[module_name], class_name)
+
+# loading model bundle (or any pickle which may hold classes of this file)
+def load_model_file(path):
+	with open(path, 'rb') as model_file:
+		unpickler = pickle.Unpickler(model_file)
+		unpickler.find_global = find_pipeline_class
+		return unpickler.load()
+
+# creating TF-IDF vectorizer used on cummulative url, title and body data
+# if vocabulary ({n-gram: column}) is given, only its n-grams are counted and min_df is not applied
+def create_tf_idf_parameters(min_df=15, vocabulary=None):
+	#create TF-IDF matrix parameters (http://scikit-learn.org/stable/modules/generated/sklearn.feature_extraction.text.TfidfTransformer.html)
+	#Parameters Explained:
+	#	min_df is set to 15, to ignore terms that have document frequency strictly lower then 15, When building the vocabulary.
+	#	analyzer is chosed to 	be word, to have feature made of words
+	#	ngram_range is set to (1,2), which specifies lower and upper boundary (to be 1 and 2 respectively) of the range of n-values for different n-grams to be extracted
+	# 	use_idf is set to True, to enable inverse-document-frequency reweighting
+	#	smooth_idf is set to True, to smooth idf weights by adding constant '1' is added to the numerator and denominator of the idf as if an extra document was seen containing every term in the collection exactly once, 
+	#			which prevents zero divisions: idf(d, t) = log [ (1 + n) / (1 + df(d, t)) ] + 1.
+
+	#	sublinear_tf is set to True, to apply sublinear tf scaling, ( i.e. replace term frequency with 1 + log(tf) )
+
+	return TfidfVectorizer(min_df=min_df, max_features=None, strip_accents='unicode', analyzer='word', ngram_range=(1, 2), use_idf=True, smooth_idf=True, sublinear_tf=True, vocabulary=vocabulary)
+
+# preprocessor of TF-IDF vectorizer dropping words_to_ignore from a document, before it is lowercased and its accents are stripped as by default preprocessor
+# words are matched against text.split() of the decoded document, so exactly the words remove_words() would remove are dropped
+# (a class, not a closure, so that vectorizers using it can be pickled into cache and model bundle)
+class RemoveWordsPreprocessor(object):
+	def __init__(self, words_to_ignore, strip_accents=None, lowercase=True):
+		self.words_to_ignore = frozenset(words_to_ignore)
+		self.strip_accents = strip_accents
+		self.lowercase = lowercase
+
+	def __call__(self, text):
+		text = u' '.join(word for word in text.split() if word not in self.words_to_ignore)
+		if self.lowercase:
+			text = text.lower()
+		if self.strip_accents == 'unicode':
+			text = strip_accents_unicode(text)
+		elif self.strip_accents == 'ascii':
+			text = strip_accents_ascii(text)
+		return text
+
 # creating TF-IDF matrix
-def create_TF_IDF(train_data, test_data, model):
+# vocabulary, idf vector and matrix are built in one pass over the documents with fit_transform(), min_df pruning is applied to the counted matrix
+# words_to_ignore (high frequency words) are dropped by the preprocessor of model while documents are tokenized, before n-grams are made, same as removing them from the text first
+def create_TF_IDF(train_data, test_data, model, words_to_ignore=None):
 	# combine train and test data containing words
 	cummulative_data = train_data + test_data
 
-	# Learn the idf vector, to apply in transformation below
-	print ("\nLearning IDF Vector...		started at "+time.strftime("%H:%M:%S", time.localtime()))
-	model.fit(cummulative_data)
+	if words_to_ignore is not None:
+		# documents are decoded before they reach the preprocessor, so words are decoded the same way
+		model.set_params(preprocessor=RemoveWordsPreprocessor([model.decode(word) for word in words_to_ignore], model.strip_accents, model.lowercase))
 
-	# Transform matrix
-	print ("\nTransforming data to create TF-IDF matrix...		started at "+time.strftime("%H:%M:%S", time.localtime()))
+	# Learn the idf vector and transform matrix
+	print ("\nLearning IDF Vector and transforming data to create TF-IDF matrix...		started at "+time.strftime("%H:%M:%S", time.localtime()))
 	# creating tf-idf matrix of dimentions (n_samples) x (n_features)
-	cummulative_data = model.transform(cummulative_data)
+	cummulative_data = model.fit_transform(cummulative_data)
 
 	#seperating into train and test features, and returning 
 	return (cummulative_data[:len(train_data)], cummulative_data[len(train_data):])
 
 
+# returns vocabulary of vectorizer reduced to n-grams kept by feature_selector (logit model fitted on TF-IDF matrix of vectorizer), as {n-gram: column}
+# kept columns are found by transforming a row holding column number + 1 in every column, so that same rule as feature_selector.transform() is used
+# columns keep their order, so a vectorizer created with this vocabulary gives same columns as feature_selector.transform() of the full matrix
+def selected_vocabulary(vectorizer, feature_selector):
+	columns = feature_selector.transform(sp.csr_matrix(np.arange(1.0, len(vectorizer.vocabulary_) + 1)))
+	selected = sp.csr_matrix(columns).data.astype(int) - 1
+	terms = dict((column, term) for term, column in vectorizer.vocabulary_.iteritems())
+	return dict((terms[column], index) for index, column in enumerate(selected))
+
+## corpus statistics
+# splitting preprocessed text into words, used as analyzer of CountVectorizer so that words are same as in text.split()
+def split_words(text):
+	return text.split()
+
+# Per-category(ephimeral/evergreen) normalized term frequencies of every word in words_list
+# Words of all documents are counted once into a sparse document-term matrix, and counts of each category are summed with one sparse product,
+# giving a 2 x vocabulary table instead of counting words in python dicts.
+# y value 1 indicates evergreen website, y value 0 indicates non-evergreen(ephimeral) website
+class CorpusStatistics(object):
+	def __init__(self, words_list, yvalues):
+		yvalues = np.asarray(yvalues)
+		if not np.all((yvalues == 1) | (yvalues == 0)):
+			raise Exception("Y value is not 1 or 0 in train data")
+		counter = CountVectorizer(analyzer=split_words)
+		term_counts = counter.fit_transform(words_list)
+		self.vocabulary = np.array(counter.get_feature_names(), dtype=object)
+
+		# row 0 selects evergreen documents, row 1 selects ephimeral documents
+		categories = sp.csr_matrix(np.vstack((yvalues == 1, yvalues == 0)).astype(np.float64))
+		category_counts = np.asarray((categories * term_counts).todense())
+
+		#normalizing term frequencies to convert them into fraction of frequency of occurance of words
+		word_counts = np.maximum(category_counts.sum(axis=1), 1.0)
+		self.term_frequency_evergreen = category_counts[0] / word_counts[0]
+		self.term_frequency_ephimeral = category_counts[1] / word_counts[1]
+
+	# creating statistics from per-category word counts (Counter or dict of word -> count), as collected while streaming
+	@classmethod
+	def from_counts(cls, term_count_evergreen, term_count_ephimeral):
+		statistics = cls.__new__(cls)
+		statistics.vocabulary = np.array(sorted(set(term_count_evergreen) | set(term_count_ephimeral)), dtype=object)
+		for name, term_count in (('term_frequency_evergreen', term_count_evergreen), ('term_frequency_ephimeral', term_count_ephimeral)):
+			counts = np.array([term_count.get(word, 0) for word in statistics.vocabulary], dtype=np.float64)
+			setattr(statistics, name, counts / max(counts.sum(), 1.0))
+		return statistics
+
+	# returns per-category term frequencies as a DataFrame indexed by word, for inspection
+	def frequency_table(self):
+		return p.DataFrame({'evergreen': self.term_frequency_evergreen, 'ephimeral': self.term_frequency_ephimeral}, index=self.vocabulary)
+
+	# returns set of words having higher frequency than thresholds in both categories
+	# ephimeral_threshold is same as evergreen_threshold if not given
+	def high_frequency_words(self, evergreen_threshold=0.0001, ephimeral_threshold=None):
+		if ephimeral_threshold is None:
+			ephimeral_threshold = evergreen_threshold
+		selected = (self.term_frequency_evergreen > evergreen_threshold) & (self.term_frequency_ephimeral > ephimeral_threshold)
+		return set(self.vocabulary[selected])
+
+# removing words_to_ignore (a set) from every text
+def remove_words(texts, words_to_ignore):
+	return [' '.join(word for word in text.split() if word not in words_to_ignore) for text in texts]
+
 # This function returns highly frequent words in both categories(ephimeral/evergreen)
 # the returned words are of not much importance in model being learned and can act as outliers, so are removed from dataset later
-def get_high_frequence_words(words_list, yvalues):
-	# y value 1 indicates evergrees website
-	# y value 0 indicates non-evergreen(ephimeral) website
-	all_words_present = []
-	term_frequency_evergreen_dict = {}
-	term_frequency_ephimeral_dict = {}
-	word_count_evergreen = 0
-	word_count_ephimeral = 0
-	for doc in range(len(yvalues)):
-		if(yvalues[doc] == 1):
-			#evergreen website
-			for word in words_list[doc].split():
-				if(word not in all_words_present):
-					all_words_present.append(word)
-				if (word in term_frequency_evergreen_dict):
-					term_frequency_evergreen_dict[word] += 1
-				else:
-					term_frequency_evergreen_dict[word] = 1
-				word_count_evergreen += 1 #this is used for normalization later
-		elif(yvalues[doc] == 0):
-			#non-evergreen(ephimeral) website
-			for word in words_list[doc].split():
-				if(word not in all_words_present):
-					all_words_present.append(word)
-				if (word in term_frequency_ephimeral_dict):
-					term_frequency_ephimeral_dict[word] += 1
-				else:
-					term_frequency_ephimeral_dict[word] = 1
-				word_count_ephimeral += 1 #this is used for normalization later
-		else:
-			raise Exception("Y value is not 1 or 0 in train data")
+# frequency_threshold defaults to 0.0001, we came up with these values by printing per-category term frequencies and looking at percentage of words have higher frequencies
+def get_high_frequence_words(words_list, yvalues, frequency_threshold=0.0001):
+	return sorted(CorpusStatistics(words_list, yvalues).high_frequency_words(frequency_threshold))
+
+# creating Support Vector Machine used by "svm" (linear) and "kernel_svm" models of fit_train_and_test_data()
+def create_svm_parameters(kernel=False):
+	if kernel:
+		#create parameters, to implement Support Vector Machine ( http://scikit-learn.org/stable/modules/generated/sklearn.svm.SVC.html )
+		#training time of kernel SVC grows faster than number of samples, and probability=True adds 5 fold cross validation on top, so it is only usable on a few thousand pages
+		#Parameters Explained:
+		#	probability is set to True, to enable probability estimates
+		#	max_iter is set to -1, to indicate no limit on number of iterations
+		#	tol is set to 0.0001, this is tolerance for stopping criteria
+		#	C is set to 1.0, Penalty parameter C of the error term
+		#	class_weight is set to None, to set weights of classes as 1
+		#	random_state is set to None, this is seed of the pseudo random number generator to use when shuffling the data
+		return svm.SVC(probability = True, max_iter = 1000, tol=0.0001, C=1.0, class_weight=None, random_state=None)
+
+	#create parameters, to implement linear Support Vector Machine ( http://scikit-learn.org/stable/modules/generated/sklearn.svm.LinearSVC.html )
+	#with probabilities calibrated by sigmoid (Platt) scaling ( http://scikit-learn.org/stable/modules/generated/sklearn.calibration.CalibratedClassifierCV.html )
+	#LinearSVC is trained by liblinear in time linear in number of samples on sparse TF-IDF data
+	#Parameters Explained:
+	#	tol is set to 0.0001, this is tolerance for stopping criteria
+	#	C is set to 1.0, Penalty parameter C of the error term
+	#	class_weight is set to None, to set weights of classes as 1
+	#	method is set to "sigmoid", to fit Platt scaling on decision function of LinearSVC
+	#	cv is set to 3, LinearSVC is fitted on 2/3 of data and calibrated on the rest, 3 times, and probabilities are averaged
+	return CalibratedClassifierCV(svm.LinearSVC(tol=0.0001, C=1.0, class_weight=None, random_state=None), method='sigmoid', cv=3)
+
+## model selection
+# Parameters searched for every model with --select-model.
+# path_parameter of a model is its regularization parameter, its values are ordered from strongest to weakest regularization and are fitted one after another
+# in the same task, so that train and test rows of a fold are taken out of the TF-IDF matrix once for all values.
+# (none of the estimators used here supports warm_start, every value is fitted from scratch)
+# Every other combination of parameters is searched as a grid, or n_candidates of them are picked at random.
+model_parameter_grids = {
+	"logit": ('C', {'C': [0.1, 0.3, 1.0, 3.0, 10.0], 'tol': [0.0001, 0.001]}),
+	"svm": ('base_estimator__C', {'base_estimator__C': [0.1, 0.3, 1.0, 3.0, 10.0], 'base_estimator__tol': [0.0001, 0.001]}),
+	"kernel_svm": ('C', {'C': [0.1, 0.3, 1.0, 3.0, 10.0], 'tol': [0.0001, 0.001]}),
+	"naive": ('alpha', {'alpha': [1.0, 0.5, 0.1, 0.05, 0.01]}),
+}
+
+# fitting estimator on train rows for every value of path_parameter, returns roc_auc on test rows for every value
+# kept at module level so that joblib can send it to worker processes
+def fit_regularization_path(estimator, path_parameter, path_values, data, y_data, train, test):
+	train_data, test_data = data[train], data[test]
+	scores = []
+	for value in path_values:
+		estimator.set_params(**{path_parameter: value})
+		estimator.fit(train_data, y_data[train])
+		scores.append(metrics.roc_auc_score(y_data[test], estimator.predict_proba(test_data)[:,1]))
+	return scores
+
+# searching parameters of estimator with cv fold cross validation, every (parameters, fold) pair is fitted in one of n_jobs processes
+# joblib memory-maps large arrays (here data, indices and indptr of the TF-IDF matrix), so processes share one read-only copy of data
+# returns estimator refitted on full data with best parameters, which replaces the separate fit on full data
+def search_parameters(estimator, model, data, y_data, cv=10, n_jobs=-1, n_candidates=None, random_state=0):
+	path_parameter, parameter_grid = model_parameter_grids[model]
+	path_values = parameter_grid[path_parameter]
+	candidates = list(grid_search.ParameterGrid(dict((name, values) for name, values in parameter_grid.items() if name != path_parameter)))
+	if n_candidates is not None and n_candidates < len(candidates):
+		candidates = [candidates[index] for index in np.random.RandomState(random_state).permutation(len(candidates))[:n_candidates]]
+	y_data = np.asarray(y_data)
+	folds = list(cross_validation.StratifiedKFold(y_data, n_folds=cv))
+
+	scores = Parallel(n_jobs=n_jobs)(delayed(fit_regularization_path)(clone(estimator).set_params(**parameters), path_parameter, path_values, data, y_data, train, test)
+		for parameters in candidates for train, test in folds)
+	# averaging over folds, giving candidates x path_values table of mean roc_auc
+	scores = np.array(scores).reshape(len(candidates), len(folds), len(path_values)).mean(axis=1)
+	best_candidate, best_value = np.unravel_index(np.argmax(scores), scores.shape)
+	best_parameters = dict(candidates[best_candidate])
+	best_parameters[path_parameter] = path_values[best_value]
+	print "\nBest parameters: ", best_parameters, ", "+str(cv)+" Fold CV Score: ", scores[best_candidate, best_value]
 
-	#normalizing term frequencies to convert them into fraction of frequency of occurance of words
-	for i in term_frequency_evergreen_dict: #evergreen website
-		term_frequency_evergreen_dict[i] /= (1.0*word_count_evergreen)
-		# print term_frequency_evergreen_dict[i]
-
-	for i in term_frequency_ephimeral_dict: #non-evergreen(ephimeral) website
-		term_frequency_ephimeral_dict[i] /= (1.0*word_count_ephimeral)
-		# print term_frequency_ephimeral_dict[i]
-	
-	#createng a list of words which have high frequency in both category's(evergreen/ephimeral) data 
-	high_frequency_words = []
-	frequency_threshold = 0.0001 # we came up with these values by printing above constructed dictionaries and looking at percentage of words have higher frequencies
-	for word in all_words_present:
-		if( (word in term_frequency_evergreen_dict) and (word in term_frequency_ephimeral_dict) ):
-			if( (term_frequency_evergreen_dict[word] > frequency_threshold) and (term_frequency_ephimeral_dict[word] > frequency_threshold) ):
-				high_frequency_words.append(word)
-	return high_frequency_words
+	print ("\nTraining on full data with best parameters and constructing output files...		started at "+time.strftime("%H:%M:%S", time.localtime()))
+	return clone(estimator).set_params(**best_parameters).fit(data, y_data)
 
 #fitting based on model: Regularized Logistic Regression, SVM, Naive Bayesian
-def fit_train_and_test_data(train_data, test_data, y_train_data, model):
+# if return_models is True, feature selector (None if features are not reduced) and fitted classifier are returned along with predictions
+#	select_parameters is set to True to search parameters in model_parameter_grids instead of using ones below
+#	n_jobs is the number of processes used in cross validation and parameter search, -1 uses all cpu cores
+#	select_features is set to False to skip logit feature selection, when features were already reduced by a selected vocabulary
+def fit_train_and_test_data(train_data, test_data, y_train_data, model, return_models=False, select_parameters=False, n_jobs=1, n_candidates=None, select_features=True):
 	if (model == "logit"):
 		#create parameters, to implement Regularized Logistic Regression ( http://scikit-learn.org/stable/modules/generated/sklearn.linear_model.LogisticRegression.html )
 		#Parameters Explained:
@@ -175,11 +766,16 @@ def fit_train_and_test_data(train_data, test_data, y_train_data, model):
 		
 		# transforming data, fitting logistic regression model
 		print ( "\nApplying Logistic regression on train data...		started at "+time.strftime("%H:%M:%S", time.localtime()) )
-		logistic_regression_parameters.fit(train_data,y_train_data)
+		feature_selector = None
+		if select_features:
+			with metrics.stage('feature_selection', documents=train_data.shape[0]):
+				logistic_regression_parameters.fit(train_data,y_train_data)
 
-		#transforming features in both train and test data to reduce it to have only most important features useful in learning model
-		train_data = logistic_regression_parameters.transform(train_data)
-		test_data = logistic_regression_parameters.transform(test_data)
+				#transforming features in both train and test data to reduce it to have only most important features useful in learning model
+				#a copy of the model is kept as feature selector, as the model is fitted again on reduced features below
+				feature_selector = copy.deepcopy(logistic_regression_parameters)
+				train_data = feature_selector.transform(train_data)
+				test_data = feature_selector.transform(test_data)
 
 		#Evaluating score on Train Data by taking mean of scores from 10 fold cross validation
 		#Parameters Explained:
@@ -188,30 +784,29 @@ def fit_train_and_test_data(train_data, test_data, y_train_data, model):
 		#	target variable to predict is y_train_data
 		#	cv is set to 10, to have 10 fold cross validation
 		#	scoring is set to roc_auc(Receiver Operating Characteristic - Area Under Curve)
-		print "\n10 Fold CV Score after transforming and doing Regularized Logistic Regularized on train data: ", np.mean(cross_validation.cross_val_score(logistic_regression_parameters, train_data, y_train_data, cv=10, scoring='roc_auc'))
+		if select_parameters:
+			with metrics.stage('parameter_search', documents=train_data.shape[0]):
+				logistic_regression_parameters = search_parameters(logistic_regression_parameters, model, train_data, y_train_data, 10, n_jobs, n_candidates)
+		else:
+			with metrics.stage('cross_validation', documents=train_data.shape[0]):
+				print "\n10 Fold CV Score after transforming and doing Regularized Logistic Regularized on train data: ", np.mean(cross_validation.cross_val_score(logistic_regression_parameters, train_data, y_train_data, cv=10, scoring='roc_auc', n_jobs=n_jobs))
 
-		# Run logistic regression
-		print ("\nTraining on full data and constructing output files...		started at "+time.strftime("%H:%M:%S", time.localtime()))
-		logistic_regression_parameters.fit(train_data, y_train_data)
+			# Run logistic regression
+			print ("\nTraining on full data and constructing output files...		started at "+time.strftime("%H:%M:%S", time.localtime()))
+			with metrics.stage('training', documents=train_data.shape[0]):
+				logistic_regression_parameters.fit(train_data, y_train_data)
 
 		#predicting probabilities of class to which sample belongs to...
-		predicted_train = logistic_regression_parameters.predict_proba(train_data)[:,1]
-		predicted_test = logistic_regression_parameters.predict_proba(test_data)[:,1]
+		with metrics.stage('prediction', documents=train_data.shape[0] + test_data.shape[0]):
+			predicted_train = logistic_regression_parameters.predict_proba(train_data)[:,1]
+			predicted_test = logistic_regression_parameters.predict_proba(test_data)[:,1]
+		if return_models:
+			return (predicted_train, predicted_test, feature_selector, logistic_regression_parameters)
 		return (predicted_train, predicted_test)
 
-	elif (model == "svm"):
-		#create parameters, to implement Support Vector Machine ( http://scikit-learn.org/stable/modules/generated/sklearn.svm.SVC.html )
-		#Parameters Explained:
-		#	probability is set to True, to enable probability estimates
-		#	max_iter is set to -1, to indicate no limit on number of iterations
-		#	tol is set to 0.0001, this is tolerance for stopping criteria
-		#	C is set to 1.0, Penalty parameter C of the error term
-		#	class_weight is set to None, to set weights of classes as 1
-		#	random_state is set to None, this is seed of the pseudo random number generator to use when shuffling the data
-		svm_parameters = svm.SVC(probability = True, max_iter = 1000, tol=0.0001, C=1.0, class_weight=None, random_state=None)
-		# transforming data, fitting logistic regression model
+	elif (model == "svm" or model == "kernel_svm"):
+		svm_parameters = create_svm_parameters(model == "kernel_svm")
 		print ( "\nApplying Support Vector Machine Learning on train data...		started at "+time.strftime("%H:%M:%S", time.localtime()) )
-		svm_parameters.fit(train_data,y_train_data)
 
 		#Evaluating score on Train Data by taking mean of scores from 10 fold cross validation
 		#Parameters Explained:
@@ -220,15 +815,24 @@ def fit_train_and_test_data(train_data, test_data, y_train_data, model):
 		#	target variable to predict is y_train_data
 		#	cv is set to 10, to have 10 fold cross validation
 		#	scoring is set to roc_auc(Receiver Operating Characteristic - Area Under Curve)
-		print "\n10 Fold CV Score after transforming and doing Support Vector Machine Learning on train data: ", np.mean(cross_validation.cross_val_score(svm_parameters, train_data, y_train_data, cv=10, scoring='roc_auc'))
+		if select_parameters:
+			with metrics.stage('parameter_search', documents=train_data.shape[0]):
+				svm_parameters = search_parameters(svm_parameters, model, train_data, y_train_data, 10, n_jobs, n_candidates)
+		else:
+			with metrics.stage('cross_validation', documents=train_data.shape[0]):
+				print "\n10 Fold CV Score after transforming and doing Support Vector Machine Learning on train data: ", np.mean(cross_validation.cross_val_score(svm_parameters, train_data, y_train_data, cv=10, scoring='roc_auc', n_jobs=n_jobs))
 
-		# Run SVM
-		print ("\nTraining on full data and constructing output files...		started at "+time.strftime("%H:%M:%S", time.localtime()))
-		svm_parameters.fit(train_data,y_train_data)
+			# Run SVM
+			print ("\nTraining on full data and constructing output files...		started at "+time.strftime("%H:%M:%S", time.localtime()))
+			with metrics.stage('training', documents=train_data.shape[0]):
+				svm_parameters.fit(train_data,y_train_data)
 
 		#predicting probabilities of class to which sample belongs to...
-		predicted_train = svm_parameters.predict_proba(train_data)[:,1]
-		predicted_test = svm_parameters.predict_proba(test_data)[:,1]
+		with metrics.stage('prediction', documents=train_data.shape[0] + test_data.shape[0]):
+			predicted_train = svm_parameters.predict_proba(train_data)[:,1]
+			predicted_test = svm_parameters.predict_proba(test_data)[:,1]
+		if return_models:
+			return (predicted_train, predicted_test, None, svm_parameters)
 		return (predicted_train, predicted_test)
 
 	elif (model == "naive"):
@@ -239,10 +843,7 @@ def fit_train_and_test_data(train_data, test_data, y_train_data, model):
 		#       Array for class prior probabilities. If this is not specifies ( None ), then they are adjusted according to the data.
 		naive_parameters = naive.MultinomialNB(alpha=1.0, fit_prior=True, class_prior=None)
 
-		# transforming data, fitting logistic regression model
 		print ( "Applying Multinomail Naive Bayesian on train data...               started at "+time.strftime("%H:%M:%S", time.localtime()))               
-		naive_parameters.fit(train_data,y_train_data)
-
 
 		#Evaluating score on Train Data by taking mean of scores from 10 fold cross validation
 		#Parameters Explained:
@@ -251,119 +852,469 @@ def fit_train_and_test_data(train_data, test_data, y_train_data, model):
 		#       target variable to predict is y_train_data
 		#       cv is set to 10, to have 10 fold cross validation
 		#       scoring is set to roc_auc(Receiver Operating Characteristic - Area Under Curve)
-		print ("10 Fold CV Score after transforming and doing MultinomialNB on train data: ", np.mean(cross_validation.cross_val_score(naive_parameters, train_data, y_train_data, cv=10, scoring='roc_auc')))
+		if select_parameters:
+			with metrics.stage('parameter_search', documents=train_data.shape[0]):
+				naive_parameters = search_parameters(naive_parameters, model, train_data, y_train_data, 10, n_jobs, n_candidates)
+		else:
+			with metrics.stage('cross_validation', documents=train_data.shape[0]):
+				print ("10 Fold CV Score after transforming and doing MultinomialNB on train data: ", np.mean(cross_validation.cross_val_score(naive_parameters, train_data, y_train_data, cv=10, scoring='roc_auc', n_jobs=n_jobs)))
 
-		#Run Multinomial Naive Bayesian
-		print ("Training on full data and constructing output files...          started at "+time.strftime("%H:%M:%S", time.localtime()))
-		naive_parameters.fit(train_data,y_train_data)
+			#Run Multinomial Naive Bayesian
+			print ("Training on full data and constructing output files...          started at "+time.strftime("%H:%M:%S", time.localtime()))
+			with metrics.stage('training', documents=train_data.shape[0]):
+				naive_parameters.fit(train_data,y_train_data)
 
 		#predicting probabilities of class to which sample belongs to...
-		predicted_train = naive_parameters.predict_proba(train_data)[:,1]
-		predicted_test = naive_parameters.predict_proba(test_data)[:,1]
+		with metrics.stage('prediction', documents=train_data.shape[0] + test_data.shape[0]):
+			predicted_train = naive_parameters.predict_proba(train_data)[:,1]
+			predicted_test = naive_parameters.predict_proba(test_data)[:,1]
+		if return_models:
+			return (predicted_train, predicted_test, None, naive_parameters)
 		return (predicted_train, predicted_test)
 
 	else:
 		raise Exception("Undefined model specified to use in classification")
 
+## streaming
+# Streaming mode reads train.tsv and test.tsv once, chunksize rows at a time, and never keeps a whole dataset in memory.
+# Pass 1 preprocesses every chunk and spools "urlid<TAB>label<TAB>url title body" lines to a temporary file, counting words per category on the way.
+# Later passes read spooled documents back in chunks, remove high frequency words, hash them into a TF-IDF matrix and train/predict with SGDClassifier.
+# Peak memory is bounded by chunk size, number of hashed features and the per-category word counts, not by number of documents.
 
-if __name__ == "__main__":
-	#loading train and test data
-	print ("\nLoading input...\n")
-	x_traindata = list(np.array(p.read_table('../data/train.tsv'))[:,2])
-	x_testdata = list(np.array(p.read_table('../data/test.tsv'))[:,2])
-	y_train = np.array(p.read_table('../data/train.tsv'))[:,-1] #last rwo consists of output values in train data
-	y_train=y_train.astype(int)
-
-	# loading url from both train and test data
-	x_url_train = list(np.array(p.read_table('../data/train.tsv'))[:,0])
-	x_url_test = list(np.array(p.read_table('../data/test.tsv'))[:,0])
-
-
-	print ("\nPreprocessing boilerplate and url...		started at "+time.strftime("%H:%M:%S", time.localtime()))
-
-	x_train_title_list = []
-	x_train_body_list = []
-	x_test_title_list = []
-	x_test_body_list = []
-
-	#using WordNetLemmatizer for stemming boilerplate content 
-	for temp_data in x_traindata:
-			temp_title, temp_body=extract_content(temp_data, "WordNetLemmatizer")
-			x_train_title_list.append(temp_title)
-			x_train_body_list.append(temp_body)
-	for temp_data in x_testdata:
-			temp_title, temp_body=extract_content(temp_data, "WordNetLemmatizer")
-			x_test_title_list.append(temp_title)
-			x_test_body_list.append(temp_body)
-			
-	#here pickle module is used to print data obtained after stemming boilerplate data (https://docs.python.org/2/library/pickle.html) in serialized manner 
-	pickle.dump(x_train_title_list, open('preprocessed_train_title.p', 'wb'))
-	pickle.dump(x_train_body_list, open('preprocessed_train_body.p', 'wb'))
-	pickle.dump(x_test_title_list, open('preprocessed_test_title.p', 'wb'))
-	pickle.dump(x_test_body_list, open('preprocessed_test_body.p', 'wb'))
-
-	x_train_url_list = []
-	x_test_url_list = []
-	
-	#using WordNetLemmatizer for stemming url 
-	for url in x_url_train:
-	        x_train_url_list.append(url_cleaner(url, "WordNetLemmatizer"))
-	for url in x_url_test:
-	        x_test_url_list.append(url_cleaner(url, "WordNetLemmatizer"))
-
-	#here pickle module is used to print data obtained after stemming url (https://docs.python.org/2/library/pickle.html) in serialized manner 
-	pickle.dump(x_train_url_list, open('preprocessed_train_url.p', 'wb'))
-	pickle.dump(x_test_url_list, open('preprocessed_test_url.p', 'wb'))
-
-	#extracting features
+# preprocessing tsv file chunk by chunk and writing its documents to spool_path
+# if counts is given ({0: Counter(), 1: Counter()}), words of each document are counted under its label
+# returns number of documents written
+#	chunksize is the number of rows read at a time, preprocess_chunksize is the number of documents handed to a worker process at a time
+def spool_documents(tsv_path, spool_path, has_labels, stemmer_type="WordNetLemmatizer", workers=1, chunksize=1000, preprocess_chunksize=100, counts=None):
+	n_documents = 0
+	# one pool of worker processes serves every chunk of the file, instead of starting workers again for every chunk
+	pool = create_pool(workers)
+	try:
+		with open(spool_path, 'wb') as spool:
+			for chunk in p.read_table(tsv_path, chunksize=chunksize):
+				# columns are url, urlid, boilerplate, ... , label, same as in the in-memory path
+				x_url = list(chunk.iloc[:,0])
+				urlids = list(chunk.iloc[:,1])
+				titles, bodies = preprocess_boilerplates(list(chunk.iloc[:,2]), stemmer_type, workers, preprocess_chunksize, pool)
+				urls = preprocess_urls(x_url, stemmer_type, workers, preprocess_chunksize, pool)
+				labels = list(chunk.iloc[:,-1].astype(int)) if has_labels else [-1] * len(urlids)
+				for temp in range(len(urlids)):
+					text = urls[temp] + ' ' + titles[temp] + ' ' + bodies[temp]
+					if counts is not None:
+						if labels[temp] not in counts:
+							raise Exception("Y value is not 1 or 0 in train data")
+						counts[labels[temp]].update(text.split())
+					spool.write('%d\t%d\t%s\n' % (urlids[temp], labels[temp], text))
+				n_documents += len(urlids)
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+	return n_documents
 
-	#create TF-IDF matrix parameters (http://scikit-learn.org/stable/modules/generated/sklearn.feature_extraction.text.TfidfTransformer.html)
+# reading spooled documents back, yields (urlids, labels, texts) of chunksize documents with words_to_ignore removed
+def read_spool_chunks(spool_path, chunksize=1000, words_to_ignore=frozenset()):
+	urlids, labels, texts = [], [], []
+	with open(spool_path, 'rb') as spool:
+		for line in spool:
+			urlid, label, text = line.rstrip('\n').split('\t', 2)
+			urlids.append(int(urlid))
+			labels.append(int(label))
+			texts.append(' '.join(word for word in text.split() if word not in words_to_ignore))
+			if len(texts) == chunksize:
+				yield (urlids, labels, texts)
+				urlids, labels, texts = [], [], []
+	if texts:
+		yield (urlids, labels, texts)
+
+# returns words whose normalized term frequency is above thresholds in both categories
+# same rule as the in-memory path (CorpusStatistics.high_frequency_words()), computed from word counts collected while streaming
+def high_frequency_words_from_counts(term_count_evergreen, term_count_ephimeral, evergreen_threshold=0.0001, ephimeral_threshold=None):
+	return CorpusStatistics.from_counts(term_count_evergreen, term_count_ephimeral).high_frequency_words(evergreen_threshold, ephimeral_threshold)
+
+# out-of-core counterpart of TfidfVectorizer used in streaming mode
+# words are hashed into n_features columns instead of being kept in a vocabulary, document frequencies are accumulated chunk by chunk with partial_fit()
+# transform() applies same weighting as tf_idf_parameters: sublinear tf, smoothed idf, min_df pruning and l2 normalization
+# as columns are hashed, min_df is applied to hash buckets and colliding n-grams share one column
+class StreamingTfidf(object):
+	def __init__(self, n_features=2**20, min_df=15, ngram_range=(1, 2)):
+		self.hasher = HashingVectorizer(n_features=n_features, strip_accents='unicode', analyzer='word', ngram_range=ngram_range, non_negative=True, norm=None)
+		self.n_features = n_features
+		self.min_df = min_df
+		self.document_frequency = np.zeros(n_features)
+		self.n_documents = 0
+		self.idf = None
+
+	def partial_fit(self, texts):
+		counts = self.hasher.transform(texts)
+		self.document_frequency += np.asarray((counts > 0).sum(axis=0)).ravel()
+		self.n_documents += counts.shape[0]
+		self.idf = None
+		return self
+
+	def transform(self, texts):
+		if self.idf is None:
+			# idf(d, t) = log [ (1 + n) / (1 + df(d, t)) ] + 1, and 0 for terms below min_df
+			self.idf = np.log((1.0 + self.n_documents) / (1.0 + self.document_frequency)) + 1.0
+			self.idf[self.document_frequency < self.min_df] = 0.0
+		tf_idf = self.hasher.transform(texts).astype(np.float64).tocsr()
+		# n-grams of a page hashed to same column with opposite signs cancel out and are kept as stored zeros, which log() would turn into -inf
+		tf_idf.eliminate_zeros()
+		tf_idf.data = np.log(tf_idf.data) + 1.0
+		tf_idf = tf_idf * sp.spdiags(self.idf, 0, self.n_features, self.n_features)
+		tf_idf.eliminate_zeros()
+		return preprocessing.normalize(tf_idf, norm='l2', copy=False)
+
+# creating logistic regression trained chunk by chunk with partial_fit(), used by streaming and incremental training
+def create_sgd_parameters():
+	#create parameters, to implement l2 regularized logistic regression trained by stochastic gradient descent ( http://scikit-learn.org/stable/modules/generated/sklearn.linear_model.SGDClassifier.html )
 	#Parameters Explained:
-	#	min_df is set to 15, to ignore terms that have document frequency strictly lower then 15, When building the vocabulary.
-	#	analyzer is chosed to 	be word, to have feature made of words
-	#	ngram_range is set to (1,2), which specifies lower and upper boundary (to be 1 and 2 respectively) of the range of n-values for different n-grams to be extracted
-	# 	use_idf is set to True, to enable inverse-document-frequency reweighting
-	#	smooth_idf is set to True, to smooth idf weights by adding constant '1' is added to the numerator and denominator of the idf as if an extra document was seen containing every term in the collection exactly once, 
-	#			which prevents zero divisions: idf(d, t) = log [ (1 + n) / (1 + df(d, t)) ] + 1.
+	#	loss is set to "log", to get logistic regression and probability estimates
+	#	penalty is set to "l2", to use l2 norm penalty
+	#	alpha is set to 0.00001, this is regularization strength
+	return lm.SGDClassifier(loss='log', penalty='l2', alpha=0.00001, fit_intercept=True, random_state=0)
 
-	#	sublinear_tf is set to True, to apply sublinear tf scaling, ( i.e. replace term frequency with 1 + log(tf) )
+# streaming counterpart of the in-memory pipeline, writes predictions of train and test data to train_output and test_output
+# returns fitted vectorizer, high frequency words and classifier
+#	epochs is the number of passes made over train data while training SGDClassifier
+#	ephimeral_threshold is the frequency threshold of ephimeral pages, same as frequency_threshold if not given
+def stream_train_and_test(train_path, test_path, train_output, test_output, stemmer_type="WordNetLemmatizer", workers=1, chunksize=1000,
+							preprocess_chunksize=100, frequency_threshold=0.0001, n_features=2**20, epochs=5, ephimeral_threshold=None):
+	spool_dir = tempfile.mkdtemp(prefix='evergreen-')
+	try:
+		train_spool = os.path.join(spool_dir, 'train.txt')
+		test_spool = os.path.join(spool_dir, 'test.txt')
+
+		print ("\nStreaming and preprocessing boilerplate and url...		started at "+time.strftime("%H:%M:%S", time.localtime()))
+		counts = {0: Counter(), 1: Counter()}
+		with metrics.stage('spooling'):
+			n_documents = spool_documents(train_path, train_spool, True, stemmer_type, workers, chunksize, preprocess_chunksize, counts)
+			n_documents += spool_documents(test_path, test_spool, False, stemmer_type, workers, chunksize, preprocess_chunksize)
+		metrics.annotate('spooling', documents=n_documents, tokens=sum(counts[0].itervalues()) + sum(counts[1].itervalues()))
+
+		with metrics.stage('cummulative'):
+			high_frequency_words_to_ignore = high_frequency_words_from_counts(counts[1], counts[0], frequency_threshold, ephimeral_threshold)
+		del counts
+		print "\nNumber of high frequency words in data: ", len(high_frequency_words_to_ignore)
+		pickle.dump(high_frequency_words_to_ignore, open('high_frequency_words.p', 'wb'))
+
+		# document frequencies are learned from train and test data, as in create_TF_IDF()
+		print ("\nLearning IDF Vector...		started at "+time.strftime("%H:%M:%S", time.localtime()))
+		vectorizer = StreamingTfidf(n_features=n_features)
+		with metrics.stage('tfidf'):
+			for spool_path in (train_spool, test_spool):
+				for urlids, labels, texts in read_spool_chunks(spool_path, chunksize, high_frequency_words_to_ignore):
+					vectorizer.partial_fit(texts)
+		metrics.annotate('tfidf', documents=vectorizer.n_documents, vocabulary=int(np.count_nonzero(vectorizer.document_frequency >= vectorizer.min_df)))
+
+		print ("\nApplying Logistic regression on streamed train data...		started at "+time.strftime("%H:%M:%S", time.localtime()))
+		classifier = create_sgd_parameters()
+		with metrics.stage('training'):
+			for epoch in range(epochs):
+				for urlids, labels, texts in read_spool_chunks(train_spool, chunksize, high_frequency_words_to_ignore):
+					classifier.partial_fit(vectorizer.transform(texts), np.array(labels), classes=np.array([0, 1]))
+
+		print ("\nPredicting and constructing output files...		started at "+time.strftime("%H:%M:%S", time.localtime()))
+		with metrics.stage('prediction'):
+			for spool_path, output_path in ((train_spool, train_output), (test_spool, test_output)):
+				with open(output_path, 'wb') as output:
+					output.write('urlid,label\n')
+					for urlids, labels, texts in read_spool_chunks(spool_path, chunksize, high_frequency_words_to_ignore):
+						for urlid, predicted in zip(urlids, classifier.predict_proba(vectorizer.transform(texts))[:,1]):
+							output.write('%d,%s\n' % (urlid, predicted))
+		metrics.annotate('prediction', documents=vectorizer.n_documents)
+		return (vectorizer, high_frequency_words_to_ignore, classifier)
+	finally:
+		shutil.rmtree(spool_dir)
+
+## incremental training
+# Newly crawled and labelled pages are added to a model without training it again on all earlier pages.
+# Model state keeps per-category word counts, hashed document frequencies (StreamingTfidf) and an SGDClassifier, and an update reads only the new batch:
+# word counts of the batch are added to the counts (high frequency words are chosen again from them), document frequencies of the batch are added with partial_fit(),
+# and the classifier makes epochs passes of partial_fit() over the batch. Cost of an update depends on batch size (plus size of the word count tables), not on number of pages seen so far.
+# Every saved model is a new version, saved as model_state-<version>.p in the model state directory, so that a model can be rolled back to any earlier version.
+# Version numbers are never reused: a model updated from an earlier version is saved after the latest one, and history keeps the version it was updated from.
+# Saved states are model bundles too, and can be given directly to score.py.
+class IncrementalModel(object):
+	def __init__(self, n_features=2**20, min_df=15, frequency_threshold=0.0001, ephimeral_threshold=None):
+		self.vectorizer = StreamingTfidf(n_features=n_features, min_df=min_df)
+		self.classifier = create_sgd_parameters()
+		self.counts = {0: Counter(), 1: Counter()} # label -> word counts of all pages seen
+		self.frequency_threshold = frequency_threshold
+		self.ephimeral_threshold = ephimeral_threshold
+		self.high_frequency_words = frozenset()
+		self.version = 0 # version this model was loaded from or saved as, 0 if never saved
+		self.batches = [] # (pages in batch, batch file, time) of every update since version
+		self.history = [] # (version, parent version, batches) of every saved version
+
+	# adding pages of labelled tsv file (same columns as train.tsv) to the model, returns number of pages added
+	#	epochs is the number of passes made over the batch while updating the classifier
+	def update(self, tsv_path, stemmer_type="WordNetLemmatizer", workers=1, chunksize=1000, preprocess_chunksize=100, epochs=1):
+		spool_dir = tempfile.mkdtemp(prefix='evergreen-')
+		try:
+			spool_path = os.path.join(spool_dir, 'batch.txt')
+			counts = {0: Counter(), 1: Counter()}
+			with metrics.stage('spooling'):
+				n_documents = spool_documents(tsv_path, spool_path, True, stemmer_type, workers, chunksize, preprocess_chunksize, counts)
+			metrics.annotate('spooling', documents=n_documents, tokens=sum(counts[0].itervalues()) + sum(counts[1].itervalues()))
+
+			with metrics.stage('cummulative'):
+				for label in counts:
+					self.counts[label].update(counts[label])
+				self.high_frequency_words = frozenset(high_frequency_words_from_counts(self.counts[1], self.counts[0], self.frequency_threshold, self.ephimeral_threshold))
+			del counts
+			metrics.annotate('cummulative', high_frequency_words=len(self.high_frequency_words))
+
+			with metrics.stage('tfidf', documents=n_documents):
+				for urlids, labels, texts in read_spool_chunks(spool_path, chunksize, self.high_frequency_words):
+					self.vectorizer.partial_fit(texts)
+
+			# earlier pages are not seen again, SGDClassifier keeps its learning rate schedule between calls, so later batches move weights less
+			with metrics.stage('training', documents=n_documents * epochs):
+				for epoch in range(epochs):
+					for urlids, labels, texts in read_spool_chunks(spool_path, chunksize, self.high_frequency_words):
+						self.classifier.partial_fit(self.vectorizer.transform(texts), np.array(labels), classes=np.array([0, 1]))
+		finally:
+			shutil.rmtree(spool_dir)
+
+		self.batches.append((n_documents, tsv_path, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())))
+		return n_documents
+
+	# returns evergreen probability of every preprocessed text
+	def predict_proba(self, texts):
+		texts = remove_words(texts, self.high_frequency_words)
+		return self.classifier.predict_proba(self.vectorizer.transform(texts))[:,1]
+
+	# saving model as next version (one after the latest version in state_dir) in state_dir, returns its path
+	def save(self, state_dir, stemmer_type="WordNetLemmatizer"):
+		if not os.path.isdir(state_dir):
+			os.makedirs(state_dir)
+		version = max(saved_model_versions(state_dir) + [0]) + 1
+		path = model_state_path(state_dir, version)
+		if os.path.exists(path):
+			raise Exception("Model state version %d already exists in %s" % (version, state_dir))
+		self.history.append((version, self.version, self.batches))
+		self.version, self.batches = version, []
+		save_model_bundle(path, self.vectorizer, self.high_frequency_words, None, self.classifier, stemmer_type, model_state=self, version=self.version)
+		return path
+
+def model_state_path(state_dir, version):
+	return os.path.join(state_dir, 'model_state-%04d.p' % version)
+
+# returns sorted version numbers of model states saved in state_dir
+def saved_model_versions(state_dir):
+	versions = []
+	for path in glob.glob(os.path.join(state_dir, 'model_state-*.p')):
+		version = os.path.basename(path)[len('model_state-'):-len('.p')]
+		if version.isdigit():
+			versions.append(int(version))
+	return sorted(versions)
+
+# loading a version of model state saved in state_dir (latest if version is None), words stemmed so far are put in lemma table
+# returns None if state_dir has no saved version
+def load_model_state(state_dir, version=None):
+	if version is None:
+		versions = saved_model_versions(state_dir)
+		if not versions:
+			return None
+		version = versions[-1]
+	path = model_state_path(state_dir, version)
+	if not os.path.exists(path):
+		raise Exception("Model state version %d not found in %s" % (version, state_dir))
+	bundle = load_model_file(path)
+	for key, value in bundle['lemmas']:
+		lemma_table.insert(key, value)
+	return bundle['model_state']
+
+
+if __name__ == "__main__":
+	print ('Starting at '+time.strftime("%H:%M:%S", time.localtime())+'  ...')
+
+	#command line options
+	#	workers is the number of processes used to preprocess boilerplate and url, 0 uses all cpu cores
+	#	chunksize is the number of documents handed to a worker process at a time
+	#	cache_dir is the directory where results of every stage are cached, so a rerun with same data and parameters skips preprocessing
+	#	lemma_table is the file where stemmed words are kept between runs
+	#	stream switches to streaming mode (see stream_train_and_test()), for datasets which do not fit in memory
+	#	metrics_json/metrics_csv save time and memory of every stage (see PipelineMetrics), compare checks two saved runs for regressions
+	#	selected_vocabulary is the file where n-grams kept by logit feature selection are saved, a later run finding it counts only these n-grams
+	#	update adds a labelled tsv file of new pages to the latest model saved in model_state (see IncrementalModel), instead of training on train.tsv from scratch
+	parser = argparse.ArgumentParser(description="Classifying Ephemeral vs Evergreen Content on the Web")
+	parser.add_argument('--workers', type=int, default=1, help="number of preprocessing processes (0 = one per cpu core)")
+	parser.add_argument('--chunksize', type=int, default=100, help="documents sent to a preprocessing process at a time")
+	parser.add_argument('--cache-dir', default=None, help="directory to cache preprocessed data and TF-IDF matrices in (disabled if not given)")
+	parser.add_argument('--cache-keep', type=int, default=1, help="number of cache entries kept per stage")
+	parser.add_argument('--lemma-table', default=None, help="file to load the word -> lemma table from and save it to")
+	parser.add_argument('--lemma-table-size', type=int, default=500000, help="maximum number of words in the lemma table")
+	parser.add_argument('--frequency-threshold', type=float, default=0.0001, help="words more frequent than this in both categories are removed")
+	parser.add_argument('--ephimeral-threshold', type=float, default=None, help="threshold for ephimeral pages if different from --frequency-threshold")
+	parser.add_argument('--model', default='logit', choices=['logit', 'svm', 'kernel_svm', 'naive'], help="classifier to train")
+	parser.add_argument('--select-model', action='store_true', help="search classifier parameters with cross validation")
+	parser.add_argument('--candidates', type=int, default=None, help="with --select-model, number of random parameter combinations tried instead of full grid")
+	parser.add_argument('--jobs', type=int, default=1, help="processes used for cross validation and parameter search (-1 = one per cpu core)")
+	parser.add_argument('--save-bundle', default=None, help="file to save fitted model bundle to, used by score.py")
+	parser.add_argument('--stream', action='store_true', help="read data in chunks and train out-of-core, memory is bounded by --stream-chunksize")
+	parser.add_argument('--stream-chunksize', type=int, default=1000, help="rows read from tsv files at a time in streaming mode")
+	parser.add_argument('--stream-epochs', type=int, default=5, help="passes over train data in streaming mode")
+	parser.add_argument('--selected-vocabulary', default=None, help="file to save n-grams kept by logit feature selection to, or to load them from if it exists")
+	parser.add_argument('--update', default=None, metavar='TSV', help="labelled tsv file of new pages to add to the latest model in --model-state")
+	parser.add_argument('--model-state', default='model_state', help="directory of model versions saved by --update")
+	parser.add_argument('--model-version', type=int, default=None, help="with --update, version to start from instead of the latest one (result is still saved after the latest version)")
+	parser.add_argument('--update-epochs', type=int, default=1, help="passes over new pages with --update (--stream-epochs is used for the first version)")
+	parser.add_argument('--metrics-json', default=None, help="file to write per-stage time, memory and counts of this run to, as json")
+	parser.add_argument('--metrics-csv', default=None, help="file to write per-stage time, memory and counts of this run to, as csv")
+	parser.add_argument('--profile-stage', action='append', default=[], help="stage to run under cProfile, saved as profile_<stage>.prof (can be repeated)")
+	parser.add_argument('--compare', nargs=2, default=None, metavar=('BASELINE', 'CURRENT'), help="compare two --metrics-json files and exit, status 1 on regression")
+	args = parser.parse_args()
+
+	if args.compare is not None:
+		regressions = compare_metrics(args.compare[0], args.compare[1])
+		for stage, field, before, after in regressions:
+			print "Regression in ", stage, field, ": ", before, " -> ", after
+		sys.exit(1 if regressions else 0)
+	metrics.profile_stages = frozenset(args.profile_stage)
+
+	lemma_table.max_size = args.lemma_table_size
+	if args.lemma_table is not None and os.path.exists(args.lemma_table):
+		lemma_table.load(args.lemma_table)
+
+	if args.update is not None:
+		model_state = load_model_state(args.model_state, args.model_version)
+		if model_state is None:
+			model_state = IncrementalModel(frequency_threshold=args.frequency_threshold, ephimeral_threshold=args.ephimeral_threshold)
+		print ("\nUpdating model version "+str(model_state.version)+" with "+args.update+"...		started at "+time.strftime("%H:%M:%S", time.localtime()))
+		n_documents = model_state.update(args.update, "WordNetLemmatizer", args.workers, args.stream_chunksize, args.chunksize,
+								args.stream_epochs if model_state.version == 0 else args.update_epochs)
+		parent_version = model_state.version
+		state_path = model_state.save(args.model_state, "WordNetLemmatizer")
+		print "\nSaved model version ", model_state.version, " (version ", parent_version, " + ", n_documents, " new pages) in ", state_path
+		vectorizer, high_frequency_words_to_ignore, feature_selector, classifier = model_state.vectorizer, model_state.high_frequency_words, None, model_state.classifier
+	elif args.stream:
+		vectorizer, high_frequency_words_to_ignore, classifier = stream_train_and_test('../data/train.tsv', '../data/test.tsv', 'prediction_train_data.csv', 'prediction_test_data.csv', "WordNetLemmatizer",
+								args.workers, args.stream_chunksize, args.chunksize, args.frequency_threshold, epochs=args.stream_epochs, ephimeral_threshold=args.ephimeral_threshold)
+		feature_selector = None
+	else:
+		#loading train and test data
+		print ("\nLoading input...\n")
+		with metrics.stage('loading') as record:
+			x_traindata = list(np.array(p.read_table('../data/train.tsv'))[:,2])
+			x_testdata = list(np.array(p.read_table('../data/test.tsv'))[:,2])
+			y_train = np.array(p.read_table('../data/train.tsv'))[:,-1] #last rwo consists of output values in train data
+			y_train=y_train.astype(int)
+
+			# loading url from both train and test data
+			x_url_train = list(np.array(p.read_table('../data/train.tsv'))[:,0])
+			x_url_test = list(np.array(p.read_table('../data/test.tsv'))[:,0])
+			record['documents'] = len(x_traindata) + len(x_testdata)
+
+
+		print ("\nPreprocessing boilerplate and url...		started at "+time.strftime("%H:%M:%S", time.localtime()))
+
+		#using WordNetLemmatizer for stemming boilerplate content and url, spread across args.workers processes
+		stemmer_type = "WordNetLemmatizer"
+		boilerplate_key = cache_key('boilerplate', hash_rows(x_traindata), hash_rows(x_testdata), stemmer_type, 'do_remove_stopwords', True, 'json boilerplate')
+		x_train_title_list, x_train_body_list, x_test_title_list, x_test_body_list = cached_stage(args.cache_dir, 'boilerplate', boilerplate_key,
+			lambda: preprocess_boilerplates(x_traindata, stemmer_type, args.workers, args.chunksize) + preprocess_boilerplates(x_testdata, stemmer_type, args.workers, args.chunksize),
+			args.cache_keep)
+		metrics.annotate('boilerplate', documents=len(x_traindata) + len(x_testdata),
+			tokens=sum(len(text.split()) for texts in (x_train_title_list, x_train_body_list, x_test_title_list, x_test_body_list) for text in texts))
+
+		#here pickle module is used to print data obtained after stemming boilerplate data (https://docs.python.org/2/library/pickle.html) in serialized manner 
+		pickle.dump(x_train_title_list, open('preprocessed_train_title.p', 'wb'))
+		pickle.dump(x_train_body_list, open('preprocessed_train_body.p', 'wb'))
+		pickle.dump(x_test_title_list, open('preprocessed_test_title.p', 'wb'))
+		pickle.dump(x_test_body_list, open('preprocessed_test_body.p', 'wb'))
+
+		url_key = cache_key('url', hash_rows(x_url_train), hash_rows(x_url_test), stemmer_type, url_strip_list)
+		x_train_url_list, x_test_url_list = cached_stage(args.cache_dir, 'url', url_key,
+			lambda: (preprocess_urls(x_url_train, stemmer_type, args.workers, args.chunksize), preprocess_urls(x_url_test, stemmer_type, args.workers, args.chunksize)),
+			args.cache_keep)
+		metrics.annotate('url', documents=len(x_url_train) + len(x_url_test), tokens=sum(len(text.split()) for text in x_train_url_list + x_test_url_list))
+
+		#here pickle module is used to print data obtained after stemming url (https://docs.python.org/2/library/pickle.html) in serialized manner 
+		pickle.dump(x_train_url_list, open('preprocessed_train_url.p', 'wb'))
+		pickle.dump(x_test_url_list, open('preprocessed_test_url.p', 'wb'))
+
+		#extracting features
+
+		# n-grams kept by feature selection of an earlier run, only these are counted and logit feature selection is skipped
+		vocabulary = None
+		if args.selected_vocabulary is not None and os.path.exists(args.selected_vocabulary):
+			with open(args.selected_vocabulary, 'rb') as vocabulary_file:
+				vocabulary = pickle.load(vocabulary_file)
+			print "\nUsing ", len(vocabulary), " n-grams selected in an earlier run, from ", args.selected_vocabulary
+		tf_idf_parameters = create_tf_idf_parameters(vocabulary=vocabulary)
+
+
+		# putting together url, title and body of every input data point to use in feature extraction later
+		# these cummulative lists are used to ci=onstruct TF-IDF matrix and go further with classification
+		x_train_cummulative = [x_train_url_list[temp] + ' ' + x_train_title_list[temp] + ' ' + x_train_body_list[temp] for temp in range(len(x_train_body_list))]
+		x_test_cummulative = [x_test_url_list[temp] + ' ' + x_test_title_list[temp] + ' ' + x_test_body_list[temp] for temp in range(len(x_test_body_list))]
+
+		# constructing new set of highly frequent words for both categories(ephimeral/evergreen)
+		# These set of words have high frequency in the dataset and are of not much importance, as they could act as outliers in the model being learned
 
-	tf_idf_parameters = TfidfVectorizer(min_df=15, max_features=None, strip_accents='unicode', analyzer='word', ngram_range=(1, 2), use_idf=True, smooth_idf=True, sublinear_tf=True)
+		# words are not removed from the text here, create_TF_IDF() drops them while tokenizing
+		cummulative_key = cache_key('cummulative', boilerplate_key, url_key, hash_rows(y_train), args.frequency_threshold, args.ephimeral_threshold, 'words only')
+		high_frequency_words_to_ignore = cached_stage(args.cache_dir, 'cummulative', cummulative_key,
+			lambda: CorpusStatistics(x_train_cummulative, y_train).high_frequency_words(args.frequency_threshold, args.ephimeral_threshold),
+			args.cache_keep)
+		print "\nNumber of high frequency words in data: ", len(high_frequency_words_to_ignore)
+		metrics.annotate('cummulative', documents=len(x_train_cummulative) + len(x_test_cummulative), high_frequency_words=len(high_frequency_words_to_ignore))
 
+		#here pickle module is used to print data obtained after stemming url (https://docs.python.org/2/library/pickle.html) in serialized manner 
+		pickle.dump(high_frequency_words_to_ignore, open('high_frequency_words.p', 'wb'))
 
-	# putting together url, title and body of every input data point to use in feature extraction later
-	# these cummulative lists are used to ci=onstruct TF-IDF matrix and go further with classification
-	x_train_cummulative = [x_train_url_list[temp] + ' ' + x_train_title_list[temp] + ' ' + x_train_body_list[temp] for temp in range(len(x_train_body_list))]
-	x_test_cummulative = [x_test_url_list[temp] + ' ' + x_test_title_list[temp] + ' ' + x_test_body_list[temp] for temp in range(len(x_test_body_list))]
+		# creating tf-idf matrix from train and test data available from above, without high frequency words
+		# the fitted vectorizer is cached along with the matrices
+		tfidf_key = cache_key('tfidf', cummulative_key, sorted((name, value) for name, value in tf_idf_parameters.get_params().items() if name != 'vocabulary'),
+			sorted(vocabulary.items()) if vocabulary is not None else None)
+		tfidf_x_train_cummulative, tfidf_x_test_cummulative, tf_idf_parameters = cached_stage(args.cache_dir, 'tfidf', tfidf_key,
+			lambda: create_TF_IDF(x_train_cummulative, x_test_cummulative, tf_idf_parameters, high_frequency_words_to_ignore) + (tf_idf_parameters,),
+			args.cache_keep)
+		metrics.annotate('tfidf', documents=tfidf_x_train_cummulative.shape[0] + tfidf_x_test_cummulative.shape[0],
+			nnz=tfidf_x_train_cummulative.nnz + tfidf_x_test_cummulative.nnz, vocabulary=len(tf_idf_parameters.vocabulary_))
 
-	# constructing new set of highly frequent words for both categories(ephimeral/evergreen)
-	# These set of words have high frequency in the dataset and are of not much importance, as they could act as outliers in the model being learned
+		#calling fit_train_and_test_data() function to fit the train data and predict probabilities of various classes
+		predicted_train, predicted_test, feature_selector, classifier = fit_train_and_test_data(tfidf_x_train_cummulative, tfidf_x_test_cummulative, y_train, args.model,
+			return_models=True, select_parameters=args.select_model, n_jobs=args.jobs, n_candidates=args.candidates, select_features=vocabulary is None)
+		vectorizer = tf_idf_parameters
 
-	high_frequency_words_to_ignore=set(get_high_frequence_words(x_train_cummulative, y_train))
-	print "\nNumber of high frequency words in data: ", len(high_frequency_words_to_ignore)
+		# saving n-grams kept by feature selection, so that later runs (and bundles saved by them) never count other n-grams
+		if args.selected_vocabulary is not None and feature_selector is not None:
+			vocabulary = selected_vocabulary(vectorizer, feature_selector)
+			with open(args.selected_vocabulary + '.tmp', 'wb') as vocabulary_file:
+				pickle.dump(vocabulary, vocabulary_file, pickle.HIGHEST_PROTOCOL)
+			os.rename(args.selected_vocabulary + '.tmp', args.selected_vocabulary)
+			print "\nSaved ", len(vocabulary), " of ", len(vectorizer.vocabulary_), " n-grams kept by feature selection in ", args.selected_vocabulary
 
-	# removing high frequency words
-	x_train_cummulative=[' '.join(word for word in temp.split() if word not in high_frequency_words_to_ignore) for temp in x_train_cummulative]
-	x_test_cummulative=[' '.join(word for word in temp.split() if word not in high_frequency_words_to_ignore) for temp in x_test_cummulative]
+		# Write out into files
+		with metrics.stage('writing_output', documents=len(predicted_train) + len(predicted_test)):
+			train_file_params = p.read_csv('../data/train.tsv', sep="\t", na_values=['?'], index_col=1)
+			predicted_file = p.DataFrame(predicted_train, index=train_file_params.index, columns=['label'])
+			predicted_file.to_csv('prediction_train_data.csv')
 
-	#here pickle module is used to print data obtained after stemming url (https://docs.python.org/2/library/pickle.html) in serialized manner 
-	pickle.dump(high_frequency_words_to_ignore, open('high_frequency_words.p', 'wb'))
-	pickle.dump(x_train_cummulative, open('modified_train_data_with_removed_high_frequncy_words.p', 'wb'))
-	pickle.dump(x_test_cummulative, open('modified_test_data_with_removed_high_frequncy_words.p', 'wb'))
+			test_file_params = p.read_csv('../data/test.tsv', sep="\t", na_values=['?'], index_col=1)
+			test_file = p.DataFrame(predicted_test, index=test_file_params.index, columns=['label'])
+			test_file.to_csv('prediction_test_data.csv')
 
-	# creating tf-idf matrix from train and test data available from above
-	tfidf_x_train_cummulative, tfidf_x_test_cummulative=create_TF_IDF(x_train_cummulative, x_test_cummulative, tf_idf_parameters)
+	if args.save_bundle is not None:
+		save_model_bundle(args.save_bundle, vectorizer, high_frequency_words_to_ignore, feature_selector, classifier, "WordNetLemmatizer")
 
-	#calling fit_train_and_test_data() function to fit the train data and predict probabilities of various classes
-	predicted_train, predicted_test = fit_train_and_test_data(tfidf_x_train_cummulative, tfidf_x_test_cummulative, y_train, "logit")
+	if boilerplate_decoder.malformed:
+		print "\nMalformed boilerplate rows (title and body left empty): ", boilerplate_decoder.malformed
+		for example in boilerplate_decoder.examples:
+			print "	", example
 
-	# Write out into files
-	train_file_params = p.read_csv('../data/train.tsv', sep="\t", na_values=['?'], index_col=1)
-	predicted_file = p.DataFrame(predicted_train, index=train_file_params.index, columns=['label'])
-	predicted_file.to_csv('prediction_train_data.csv')
+	lemma_hit_rate, lemma_time_saved = lemma_table.stats()
+	print "\nLemma table: ", len(lemma_table.table), " words, hit rate ", lemma_hit_rate, ", about ", lemma_time_saved, " seconds saved"
+	if args.lemma_table is not None:
+		lemma_table.save(args.lemma_table)
 
-	test_file_params = p.read_csv('../data/test.tsv', sep="\t", na_values=['?'], index_col=1)
-	test_file = p.DataFrame(predicted_test, index=test_file_params.index, columns=['label'])
-	test_file.to_csv('prediction_test_data.csv')
+	print "\nStages:\n", metrics.summary()
+	if args.metrics_json is not None:
+		metrics.write_json(args.metrics_json, vars(args))
+	if args.metrics_csv is not None:
+		metrics.write_csv(args.metrics_csv)
 
 	print ('Completed at '+time.strftime("%H:%M:%S", time.localtime())+'  ...')
\ No newline at end of file
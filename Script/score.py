@@ -0,0 +1,115 @@
+import sys, json, time, argparse, numpy as np
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+import main
+
+## online scoring
+# Scores single pages (or small batches of pages) with a model bundle saved by "python main.py --save-bundle model_bundle.p"
+# Bundle is loaded once, pages go through same extract_content/url_cleaner preprocessing as training data.
+# A page is a (url, boilerplate) pair, boilerplate is the json string found in train.tsv/test.tsv
+
+# loading model bundle, words stemmed during training are put in lemma table so that scoring starts warm
+def load_model_bundle(path):
+	bundle = main.load_model_file(path)
+	for key, value in bundle['lemmas']:
+		main.lemma_table.insert(key, value)
+	# scoring a page once, so that nltk tokenizers and wordnet are loaded before first real request
+	score_documents(bundle, [('http://www.example.com/warm-up', '{"title": "Warm up", "body": "Loading tokenizers and lemmatizer."}')])
+	return bundle
+
+# preprocessing pages exactly as training data, returns url, title and body of every page put together without high frequency words
+def preprocess_documents(bundle, documents):
+	texts = []
+	for url, boilerplate in documents:
+		title, body = main.extract_content(boilerplate, bundle['stemmer_type'])
+		texts.append(main.url_cleaner(url, bundle['stemmer_type'], bundle['url_strip_list']) + ' ' + title + ' ' + body)
+	return main.remove_words(texts, bundle['high_frequency_words'])
+
+# returns evergreen probability of every page
+def score_documents(bundle, documents):
+	features = bundle['vectorizer'].transform(preprocess_documents(bundle, documents))
+	if bundle['feature_selector'] is not None:
+		features = bundle['feature_selector'].transform(features)
+	return bundle['classifier'].predict_proba(features)[:,1]
+
+def score_document(bundle, url, boilerplate):
+	return score_documents(bundle, [(url, boilerplate)])[0]
+
+# scoring a json request, which is either one {"url": ..., "boilerplate": ...} object or a list of them
+# boilerplate may be given as json string (as in tsv data) or as object, urlid is copied to the response if present
+# returns json response {"label": probability} or a list of them, raises ValueError if a page is not an object or its url/boilerplate are not strings
+def score_request(bundle, request_text):
+	request = json.loads(request_text)
+	pages = request if isinstance(request, list) else [request]
+	documents = []
+	for page in pages:
+		if not isinstance(page, dict):
+			raise ValueError("page is not a json object: %r" % (page,))
+		url, boilerplate = page.get('url', ''), page.get('boilerplate', '{}')
+		if isinstance(boilerplate, dict):
+			boilerplate = json.dumps(boilerplate)
+		if not isinstance(url, basestring) or not isinstance(boilerplate, basestring):
+			raise ValueError("url and boilerplate of a page must be strings")
+		documents.append((url, boilerplate))
+
+	response = []
+	for page, predicted in zip(pages, score_documents(bundle, documents)):
+		result = {'label': float(predicted)}
+		if 'urlid' in page:
+			result['urlid'] = page['urlid']
+		response.append(result)
+	return json.dumps(response if isinstance(request, list) else response[0])
+
+# HTTP server: POST a request to any path, response is json, bundle is kept in server.bundle
+class ScoringHandler(BaseHTTPRequestHandler):
+	def do_POST(self):
+		try:
+			request_text = self.rfile.read(int(self.headers.getheader('content-length', 0)))
+			response, status = score_request(self.server.bundle, request_text), 200
+		except (ValueError, KeyError, AttributeError, SyntaxError, TypeError) as error:
+			response, status = json.dumps({'error': str(error)}), 400
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(response)))
+		self.end_headers()
+		self.wfile.write(response)
+
+	# requests are not logged, to keep latency low
+	def log_message(self, format, *args):
+		pass
+
+def serve_http(bundle, host='127.0.0.1', port=8000):
+	server = HTTPServer((host, port), ScoringHandler)
+	server.bundle = bundle
+	print >> sys.stderr, "Scoring on http://%s:%d/" % (host, port)
+	server.serve_forever()
+
+# stdin server: one json request per line, one json response per line on stdout
+# latency percentiles of all requests are printed to stderr at end of input
+def serve_stdin(bundle, input_file=sys.stdin, output_file=sys.stdout):
+	latencies = []
+	for line in iter(input_file.readline, ''):
+		if not line.strip():
+			continue
+		start = time.time()
+		try:
+			response = score_request(bundle, line)
+		except (ValueError, KeyError, AttributeError, SyntaxError, TypeError) as error:
+			response = json.dumps({'error': str(error)})
+		latencies.append(time.time() - start)
+		output_file.write(response + '\n')
+		output_file.flush()
+	if latencies:
+		print >> sys.stderr, "Scored %d requests, latency p50 %.2f ms, p99 %.2f ms" % (len(latencies), 1000 * np.percentile(latencies, 50), 1000 * np.percentile(latencies, 99))
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Scores pages with a model bundle saved by main.py --save-bundle")
+	parser.add_argument('--bundle', default='model_bundle.p', help="model bundle file")
+	parser.add_argument('--http', type=int, default=None, metavar='PORT', help="serve requests over HTTP on this port instead of stdin")
+	parser.add_argument('--host', default='127.0.0.1', help="address to listen on with --http")
+	args = parser.parse_args()
+
+	bundle = load_model_bundle(args.bundle)
+	if args.http is not None:
+		serve_http(bundle, args.host, args.http)
+	else:
+		serve_stdin(bundle)